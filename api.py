@@ -4,18 +4,63 @@
 
 
 
-from libqtile.command.client import InteractiveCommandClient
 from libqtile.log_utils import logger
-from libqtile import hook
-# import os
+from libqtile import hook, qtile
+import os
 from socket import socket, AF_UNIX, SOCK_STREAM
-# import asyncio
+from queue import LifoQueue, Empty
+from collections import OrderedDict
+import struct
+import asyncio
+import time
+import ctypes
+import ctypes.util
+from contextlib import contextmanager
+import hidden  # not used directly, registers the hidden group lifecycle hooks
+
+
+# qtile re-executes this module (same globals) on every config reload, without
+# firing startup_complete or shutdown. the previous run's connections, subscriber
+# and socket watch are still in globals() at this point, close them before
+# they're replaced. the new ones are started at the bottom of the module.
+if "close_auto_desk" in globals():
+    close_auto_desk()
 
 
 
-QTILE_CLIENT = InteractiveCommandClient()
-NEW_CLIENT_PIDs = set()
 PATH = "/tmp/desktop-automater"
+# set to False for auto-desk builds that only speak the old one-shot protocol
+# (one connection per message, reply terminated by the server closing).
+FRAMED = True
+POOL_SIZE = 2
+TIMEOUT = 10
+# how long a hook is willing to wait on auto-desk (connect + reply) before giving up.
+DEADLINE = 0.05
+# placements are cached per WM_CLASS for this long (seconds), auto-desk pushes
+# invalidations on layout changes so this is only a backstop.
+CACHE_TTL = 300
+CACHE_SIZE = 256
+RESUBSCRIBE_DELAY = 5
+# resolve placement + clear policy in one "resolve" exchange, set to False for
+# auto-desk builds that only know auto-move / should-clear.
+BATCHED = True
+# lookups queued within this many seconds of each other share one exchange.
+BATCH_WINDOW = 0.002
+# download auto-desk's rule table and answer lookups in-process, auto-desk is
+# only asked directly while the table isn't synced.
+LOCAL_RULES = True
+SNAPSHOT_TIMEOUT = 2
+# windows waiting on their second open hook are forgotten after this long (seconds),
+# and at most this many are remembered.
+TRACKER_TTL = 60
+TRACKER_SIZE = 512
+# after this many failed requests in a row auto-desk is considered down and
+# lookups are skipped, retrying after BACKOFF seconds (doubling up to BACKOFF_MAX).
+FAILURE_THRESHOLD = 3
+BACKOFF = 1
+BACKOFF_MAX = 120
+# every framed message (both ways) is a 4 byte big-endian length followed by the body.
+HEADER = struct.Struct("!I")
 
 
 # @hook.subscribe.client_managed
@@ -23,17 +68,87 @@ PATH = "/tmp/desktop-automater"
 #     move_window(c)
 
 
-def _open_on(client):
+async def _open_on(client):
     """used to move windows when they open""" 
-    pid = client.get_pid()
+    # this function gets called twice per window opening (client_new, then client_managed).
+    # the tracker makes sure each window is only moved once.
+    wid = client.wid
+    match TRACKER.state(wid):
+        case None:
+            TRACKER.set(wid, "placing")
+            resolved = await move_window(client)
+            if TRACKER.state(wid) == "placing":
+                TRACKER.set(wid, "placed" if resolved else "unresolved")
+        case "unresolved":
+            # WM_CLASS wasn't set on the first call (spotify), try again now.
+            TRACKER.forget(wid)
+            await move_window(client)
+        case _:
+            TRACKER.forget(wid)
 
-    # this function gets called twice per window opening.
-    # bellow stops this function from moving windows that have already been moved.
-    if pid not in NEW_CLIENT_PIDs:
-        NEW_CLIENT_PIDs.add(pid)
-        move_window(client)
-    else:
-        NEW_CLIENT_PIDs.remove(pid)
+
+class WindowTracker:
+    """
+    bounded, expiring map of window id -> placement state, so the second open hook
+    knows what the first one did.
+
+    states: placing -> placed | unresolved (no WM_CLASS yet). the entry is dropped
+    on the second hook, when the window is killed, after TRACKER_TTL, or when more
+    than TRACKER_SIZE windows are being tracked (oldest first).
+    """
+
+    def __init__(self, size=TRACKER_SIZE, ttl=TRACKER_TTL):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+
+    def state(self, wid):
+        entry = self.entries.get(wid)
+        if entry is None:
+            return None
+
+        expires, state = entry
+        if expires < time.monotonic():
+            del self.entries[wid]
+            return None
+        return state
+
+    def set(self, wid, state):
+        self.entries[wid] = (time.monotonic() + self.ttl, state)
+        self.entries.move_to_end(wid)
+        self._evict()
+
+    def forget(self, wid):
+        self.entries.pop(wid, None)
+
+    def _evict(self):
+        now = time.monotonic()
+        while self.entries:
+            wid, (expires, _) = next(iter(self.entries.items()))
+            if expires >= now and len(self.entries) <= self.size:
+                return
+            del self.entries[wid]
+
+
+TRACKER = WindowTracker()
+
+
+@hook.subscribe.client_killed
+async def forget_window(client):
+    """drops killed windows from the open hook tracker"""
+    TRACKER.forget(client.wid)
+    PIDS.pop(client.wid, None)
+
+
+# window id -> pid. get_pid() is a round trip to the X server and a window's pid never changes.
+PIDS = {}
+
+
+def _pid(window):
+    pid = PIDS.get(window.wid)
+    if pid is None:
+        pid = PIDS[window.wid] = window.get_pid()
+    return pid
 
 
 @hook.subscribe.client_managed
@@ -44,32 +159,97 @@ async def open_on_backup(client):
 
     this a back up for open_on().
     """
-    _open_on(client)
+    await _open_on(client)
 
 
 @hook.subscribe.client_new
 async def open_on(client):
     """moves windows when they register"""
-    _open_on(client)
+    await _open_on(client)
 
 
 @hook.subscribe.group_window_add
 async def clear_group(group, window):
-    clearing = should_clear(group.name)
+    # usually already cached by the "resolve" that placed the window.
+    clearing = await should_clear_async(group.name)
     if clearing:
         logger.debug(f"clearing group {group.name}")
-        pid = window.get_pid()
-        for w in group.windows:
-            if w.get_pid() != pid:
-                w.togroup("hidden")
+        pid = _pid(window)
+        keep = [w for w in group.windows if _pid(w) == pid]
+        clear_windows(group, keep)
 
 
 def get_location(wm_class):
+    if RULES.synced:
+        return RULES.lookup(wm_class)
+
+    key = tuple(wm_class)
+    hit, location = PLACEMENTS.get(key)
+    if hit:
+        return location
+
     message = f"auto-move {wm_class[0]} {wm_class[1]}"
-    return send_auto_desk(message)
+    res = _request(message)
+    location = _parse_reply(message, res)
+    if _cacheable(res):
+        PLACEMENTS.put(key, location)
+    return location
+
+
+async def get_location_async(wm_class):
+    if RULES.synced:
+        return RULES.lookup(wm_class)
+
+    key = tuple(wm_class)
+    hit, location = PLACEMENTS.get(key)
+    if hit:
+        return location
+
+    message = f"auto-move {wm_class[0]} {wm_class[1]}"
+    res = await ASYNC_AUTO_DESK.request(message)
+    location = _parse_reply(message, res)
+    if _cacheable(res):
+        PLACEMENTS.put(key, location)
+    return location
+
+
+async def should_clear_async(group):
+    if RULES.synced:
+        return RULES.should_clear(group)
+
+    hit, clear = CLEAR_POLICIES.get(group)
+    if hit:
+        return clear
+
+    message = f"should-clear {group}"
+    res = await ASYNC_AUTO_DESK.request(message)
+    clear = _parse_reply(message, res) == "true"
+    logger.debug(f"should-clear res: '{clear}'")
+    if _cacheable(res):
+        CLEAR_POLICIES.put(group, clear)
+    return clear
+
+
+async def resolve(wm_class):
+    """
+    returns (group, should clear) for a window, the group is None when
+    auto-desk has no rule for it. concurrent calls get batched into one exchange.
+    """
+    if RULES.synced:
+        location = RULES.lookup(wm_class)
+        return location, location is not None and RULES.should_clear(location)
+
+    if not BATCHED:
+        location = await get_location_async(wm_class)
+        return location, location is not None and await should_clear_async(location)
+
+    return await RESOLVER.resolve(tuple(wm_class))
 
 
 def should_clear(group):
+    if RULES.synced:
+        return RULES.should_clear(group)
+
     message = f"should-clear {group}"
     res = send_auto_desk(message)
     logger.debug(f"should-clear res: '{res}'")
@@ -78,10 +258,34 @@ def should_clear(group):
 
 def send_auto_desk(message):
     """sends data to auto-desk and returns the response"""
-    location = None
+    return _parse_reply(message, _request(message))
+
+
+def _request(message):
+    """returns the raw reply from auto-desk, or None if it couldn't be reached"""
+    if not BREAKER.allow():
+        return None
 
+    try:
+        if FRAMED:
+            res = AUTO_DESK.request(message)
+        else:
+            res = _send_oneshot(message)
+    except (OSError, EOFError) as e:
+        logger.debug(f"auto-desk unreachable ({e}), dropping message '{message}'.")
+        res = None
+    except BaseException:
+        BREAKER.abandon()
+        raise
+
+    BREAKER.record(res is not None)
+    return res
+
+
+def _send_oneshot(message):
+    """the old protocol, one connection per message."""
     with socket(AF_UNIX, SOCK_STREAM) as s:
-        s.settimeout(10)
+        s.settimeout(TIMEOUT)
         try:
             s.connect(PATH)
         except FileNotFoundError:
@@ -91,38 +295,813 @@ def send_auto_desk(message):
         else:
             s.send(bytes(message, "utf-8"))
             s.shutdown(1)  # tells the server im done sending data and it can reply now.
-            res = s.recv(1024)
-            ec = res[0]
-            if len(res) >= 3:
-                location = res[2:].decode('utf-8')
-            if ec:
-                logger.error(f"got error code from auto-desk on message '{message}'.")
+            return s.recv(1024)
+
+    return None
+
+
+def _parse_reply(message, res):
+    """
+    splits an auto-desk reply into its error code and payload.
+    reply layout: <error code byte> <separator byte> <utf-8 payload>
+    """
+    location = None
+
+    if not res:
+        return location
+
+    ec = res[0]
+    if len(res) >= 3:
+        location = res[2:].decode('utf-8')
+    if ec:
+        logger.error(f"got error code from auto-desk on message '{message}'.")
 
     return location
 
 
-# untested
+class AutoDeskConnection:
+    """a single long lived, length-prefixed connection to auto-desk."""
+
+    def __init__(self, path=PATH, timeout=TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+        self.sock = None
+
+    def connect(self):
+        sock = socket(AF_UNIX, SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+        except OSError:
+            sock.close()
+            raise
+        self.sock = sock
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def request(self, message):
+        """
+        sends one framed message and returns the raw framed reply.
+        if auto-desk was restarted since the last request the dead socket is
+        detected here and the request is retried once on a fresh connection.
+        """
+        fresh = self.sock is None
+        if fresh:
+            self.connect()
+
+        try:
+            return self._exchange(message)
+        except (BrokenPipeError, ConnectionResetError, ConnectionAbortedError, EOFError):
+            self.close()
+            if fresh:
+                raise
+        except OSError:
+            # timeouts and the like leave the stream in an unknown state.
+            self.close()
+            raise
+
+        self.connect()
+        try:
+            return self._exchange(message)
+        except (OSError, EOFError):
+            self.close()
+            raise
+
+    def _exchange(self, message):
+        body = bytes(message, "utf-8")
+        self.sock.sendall(HEADER.pack(len(body)) + body)
+        (length,) = HEADER.unpack(self._recv_exact(HEADER.size))
+        return self._recv_exact(length)
+
+    def _recv_exact(self, n):
+        buf = bytearray()
+        while len(buf) < n:
+            chunk = self.sock.recv(n - len(buf))
+            if not chunk:
+                raise EOFError("auto-desk closed the connection")
+            buf += chunk
+        return bytes(buf)
+
+
+class AutoDeskPool:
+    """small pool of AutoDeskConnections so concurrent callers don't share a stream."""
+
+    def __init__(self, path=PATH, size=POOL_SIZE, timeout=TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+        self.idle = LifoQueue(maxsize=size)
+
+    def request(self, message):
+        try:
+            conn = self.idle.get_nowait()
+        except Empty:
+            conn = AutoDeskConnection(self.path, self.timeout)
+
+        try:
+            res = conn.request(message)
+        except BaseException:
+            conn.close()
+            raise
+
+        if self.idle.full():
+            conn.close()
+        else:
+            self.idle.put_nowait(conn)
+
+        return res
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except Empty:
+                return
+
+
+AUTO_DESK = AutoDeskPool()
+
+
+class AsyncAutoDeskClient:
+    """
+    asyncio version of AutoDeskConnection, runs on qtile's event loop.
+
+    every request (connect included) has to finish within `deadline` seconds,
+    a slow or dead auto-desk only costs a window its placement, never stalls the loop.
+    """
+
+    def __init__(self, path=PATH, deadline=DEADLINE):
+        self.path = path
+        self.deadline = deadline
+        self.reader = None
+        self.writer = None
+        self.lock = asyncio.Lock()
+
+    async def request(self, message):
+        """sends one message, returns the raw reply or None if the deadline was missed"""
+        if not BREAKER.allow():
+            return None
+
+        # the deadline covers waiting for the stream too, not just our own exchange.
+        try:
+            res = await asyncio.wait_for(self._locked_request(message), self.deadline)
+        except (asyncio.TimeoutError, OSError, asyncio.IncompleteReadError) as e:
+            logger.debug(f"auto-desk request '{message}' failed: {e!r}")
+            res = None
+        except BaseException:
+            # cancelled (eg. its hook task was), so auto-desk's health is still unknown.
+            BREAKER.abandon()
+            raise
+
+        BREAKER.record(res is not None)
+        return res
+
+    async def _locked_request(self, message):
+        async with self.lock:
+            try:
+                return await self._request(message)
+            except BaseException:
+                # a late reply would desync the stream, so start over before
+                # the next request gets the lock.
+                self.close()
+                raise
+
+    async def _request(self, message):
+        if not FRAMED:
+            return await self._oneshot(message)
+
+        fresh = self.writer is None
+        if fresh:
+            await self._connect()
+
+        try:
+            return await self._exchange(message)
+        except (BrokenPipeError, ConnectionResetError, asyncio.IncompleteReadError):
+            self.close()
+            if fresh:
+                raise
+
+        await self._connect()
+        return await self._exchange(message)
+
+    async def _connect(self):
+        self.reader, self.writer = await asyncio.open_unix_connection(self.path)
+
+    async def _exchange(self, message):
+        body = bytes(message, "utf-8")
+        self.writer.write(HEADER.pack(len(body)) + body)
+        await self.writer.drain()
+        (length,) = HEADER.unpack(await self.reader.readexactly(HEADER.size))
+        return await self.reader.readexactly(length)
+
+    async def _oneshot(self, message):
+        reader, writer = await asyncio.open_unix_connection(self.path)
+        try:
+            writer.write(bytes(message, "utf-8"))
+            writer.write_eof()
+            return await reader.read(1024) or None
+        finally:
+            writer.close()
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = None
+        self.writer = None
+
+
+ASYNC_AUTO_DESK = AsyncAutoDeskClient()
+
+
+async def send_auto_desk_async(message):
+    """non-blocking send_auto_desk, for use from hooks"""
+    res = await ASYNC_AUTO_DESK.request(message)
+    return _parse_reply(message, res)
+
+
+class PlacementCache:
+    """
+    LRU cache of WM_CLASS -> group with a TTL.
+    a cached None (no rule for that class) is a valid hit, hence the (hit, value) return.
+    """
+
+    def __init__(self, size=CACHE_SIZE, ttl=CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return False, None
+
+        expires, value = entry
+        if expires < time.monotonic():
+            del self.entries[key]
+            return False, None
+
+        self.entries.move_to_end(key)
+        return True, value
+
+    def put(self, key, value):
+        self.entries[key] = (time.monotonic() + self.ttl, value)
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, key=None):
+        """drops one entry, or everything if key is None"""
+        if key is None:
+            self.entries.clear()
+        else:
+            self.entries.pop(key, None)
+
+
+PLACEMENTS = PlacementCache()
+# group name -> should-clear
+CLEAR_POLICIES = PlacementCache()
+
+
+def _cacheable(res):
+    """only real answers get cached, not timeouts or auto-desk errors"""
+    return bool(res) and not res[0]
+
+
+class RuleSet:
+    """
+    local copy of auto-desk's placement and clear rules.
+
+    rules are one per line:
+        move instance <name> <group>   -> windows whose WM_CLASS instance is <name> go to <group>
+        move class <name> <group>      -> same, matched on the WM_CLASS class
+        clear <group> <true|false>     -> the group's clear policy
+
+    the instance index is checked before the class index, so a lookup is two dict gets.
+    """
+
+    def __init__(self):
+        self.synced = False
+        self.by_instance = {}
+        self.by_class = {}
+        self.clears = {}
+
+    def lookup(self, wm_class):
+        location = self.by_instance.get(wm_class[0])
+        if location is None:
+            location = self.by_class.get(wm_class[1])
+        return location
+
+    def should_clear(self, group):
+        return self.clears.get(group, False)
+
+    def apply(self, rule):
+        """adds or replaces one rule, `rule` being a split rule line"""
+        match rule:
+            case ["move", "instance", name, group]:
+                self.by_instance[name] = group
+            case ["move", "class", name, group]:
+                self.by_class[name] = group
+            case ["clear", group, policy]:
+                self.clears[group] = policy == "true"
+            case other:
+                logger.debug(f"unknown auto-desk rule '{' '.join(rule)}'")
+
+    def remove(self, rule):
+        """drops one rule, `rule` being a split rule line without its value"""
+        match rule:
+            case ["move", "instance", name, *_]:
+                self.by_instance.pop(name, None)
+            case ["move", "class", name, *_]:
+                self.by_class.pop(name, None)
+            case ["clear", group, *_]:
+                self.clears.pop(group, None)
+            case other:
+                logger.debug(f"unknown auto-desk rule '{' '.join(rule)}'")
+
+    def load(self, lines):
+        """replaces every rule with the ones in `lines`"""
+        self.by_instance = {}
+        self.by_class = {}
+        self.clears = {}
+        for line in lines:
+            if line.strip():
+                self.apply(line.split())
+        self.synced = True
+
+    async def fetch(self, path=PATH):
+        """
+        downloads a full snapshot of the rules. returns True on success.
+
+        request: framed "rules"
+        reply:   a normal framed reply (non zero error code = rules not supported),
+                 then any number of frames holding rule lines, then an empty frame.
+        """
+        try:
+            lines = await asyncio.wait_for(self._fetch(path), SNAPSHOT_TIMEOUT)
+        except (asyncio.TimeoutError, OSError, asyncio.IncompleteReadError, UnicodeDecodeError) as e:
+            logger.warning(f"couldn't fetch auto-desk rules: {e!r}")
+            return False
+
+        if lines is None:
+            logger.info("auto-desk doesn't serve its rules, using per window lookups")
+            return False
+
+        self.load(lines)
+        logger.info(f"loaded {len(lines)} auto-desk rules")
+        return True
+
+    async def _fetch(self, path):
+        reader, writer = await asyncio.open_unix_connection(path)
+        try:
+            body = b"rules"
+            writer.write(HEADER.pack(len(body)) + body)
+            await writer.drain()
+
+            async def frame():
+                (length,) = HEADER.unpack(await reader.readexactly(HEADER.size))
+                return await reader.readexactly(length)
+
+            header = await frame()
+            if not header or header[0]:
+                return None
+
+            # a chunk may end mid line, so only split once everything is in.
+            chunks = []
+            while chunk := await frame():
+                chunks.append(chunk)
+            return b"".join(chunks).decode("utf-8").splitlines()
+        finally:
+            writer.close()
+
+
+RULES = RuleSet()
+
+
+class AutoDeskSubscriber:
+    """
+    listens for messages pushed by auto-desk on a dedicated connection.
+
+    after sending a framed "subscribe" auto-desk pushes framed utf-8 messages:
+        invalidate                      -> layout changed, drop every cached placement
+                                           and clear policy
+        invalidate <instance> <class>   -> drop one WM_CLASS
+        rule-set <rule>                 -> add or replace a rule in the local RuleSet
+        rule-del <rule>                 -> drop a rule (the rule line minus its value)
+        rules-reset                     -> rule table replaced, fetch a new snapshot
+
+    with LOCAL_RULES the rule snapshot is fetched right after subscribing, so no
+    delta between the two is lost (applying one twice is harmless).
+    """
+
+    def __init__(self, path=PATH, cache=PLACEMENTS, clear_policies=CLEAR_POLICIES, rules=RULES):
+        self.path = path
+        self.cache = cache
+        self.clear_policies = clear_policies
+        self.rules = rules
+        self.task = None
+        self.fetching = None  # snapshot fetch started by a rules-reset push
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        if self.fetching is not None:
+            self.fetching.cancel()
+            self.fetching = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self._listen()
+            except (OSError, asyncio.IncompleteReadError) as e:
+                logger.debug(f"auto-desk subscription dropped: {e!r}")
+            except Exception:
+                # a bad push (eg. invalid utf-8) must not end the subscription for good.
+                logger.exception("auto-desk subscription failed")
+
+            # pushes may have been missed while disconnected.
+            self.rules.synced = False
+            self.cache.invalidate()
+            self.clear_policies.invalidate()
+            await asyncio.sleep(RESUBSCRIBE_DELAY)
+
+    async def _listen(self):
+        reader, writer = await asyncio.open_unix_connection(self.path)
+        try:
+            body = b"subscribe"
+            writer.write(HEADER.pack(len(body)) + body)
+            await writer.drain()
+            if LOCAL_RULES:
+                await self.rules.fetch(self.path)
+            while True:
+                (length,) = HEADER.unpack(await reader.readexactly(HEADER.size))
+                self.handle((await reader.readexactly(length)).decode("utf-8"))
+        finally:
+            writer.close()
+
+    def handle(self, message):
+        match message.split():
+            case ["invalidate"]:
+                self.cache.invalidate()
+                self.clear_policies.invalidate()
+            case ["invalidate", instance, wm_class]:
+                self.cache.invalidate((instance, wm_class))
+            case ["rule-set", *rule] if self.rules.synced:
+                self.rules.apply(rule)
+            case ["rule-del", *rule] if self.rules.synced:
+                self.rules.remove(rule)
+            case ["rules-reset"] if LOCAL_RULES:
+                self.rules.synced = False
+                self.cache.invalidate()
+                self.clear_policies.invalidate()
+                if self.fetching is not None:
+                    # its snapshot may be from before this reset.
+                    self.fetching.cancel()
+                # the loop only keeps a weak reference to tasks.
+                self.fetching = asyncio.get_running_loop().create_task(self.rules.fetch(self.path))
+            case ["rule-set" | "rule-del", *_]:
+                pass
+            case other:
+                logger.debug(f"unknown auto-desk push '{message}'")
+
+
+SUBSCRIBER = AutoDeskSubscriber()
+
+
+class Resolver:
+    """
+    batches placement + clear policy lookups into a single "resolve" exchange.
+
+    request:  resolve\n<instance> <class>\n<instance> <class>...
+    reply:    one "<group> <true|false>" line per window, in order. "-" as the
+              group means no rule, the clear policy is then for nothing and ignored.
+
+    lookups made within BATCH_WINDOW of each other (eg. a session restore mapping
+    a dozen windows) share one exchange, cached answers never leave the process.
+    """
+
+    def __init__(self, client, placements=PLACEMENTS, clear_policies=CLEAR_POLICIES, window=BATCH_WINDOW):
+        self.client = client
+        self.placements = placements
+        self.clear_policies = clear_policies
+        self.window = window
+        self.pending = {}  # wm_class -> future
+        self.flush_handle = None
+
+    async def resolve(self, wm_class):
+        hit, location = self.placements.get(wm_class)
+        if hit:
+            if location is None:
+                return None, False
+            hit, clear = self.clear_policies.get(location)
+            if hit:
+                return location, clear
+
+        fut = self.pending.get(wm_class)
+        if fut is None:
+            loop = asyncio.get_running_loop()
+            fut = self.pending[wm_class] = loop.create_future()
+            if self.flush_handle is None:
+                self.flush_handle = loop.call_later(self.window, self._flush)
+
+        return await asyncio.shield(fut)
+
+    def _flush(self):
+        self.flush_handle = None
+        batch, self.pending = self.pending, {}
+        asyncio.get_running_loop().create_task(self._send(batch))
+
+    async def _send(self, batch):
+        try:
+            await self._exchange(batch)
+        finally:
+            # never leave a hook waiting, whatever happened above.
+            for fut in batch.values():
+                if not fut.done():
+                    fut.set_result((None, False))
+
+    async def _exchange(self, batch):
+        classes = list(batch)
+        message = "\n".join(["resolve"] + [f"{c[0]} {c[1]}" for c in classes])
+        res = await self.client.request(message)
+        reply = _parse_reply("resolve", res)
+        lines = reply.splitlines() if reply else []
+
+        if _cacheable(res) and len(lines) != len(classes):
+            logger.error(f"auto-desk answered {len(lines)} of {len(classes)} resolve lookups.")
+
+        for i, wm_class in enumerate(classes):
+            location, clear = None, False
+            if i < len(lines):
+                group, _, policy = lines[i].partition(" ")
+                if group != "-":
+                    location, clear = group, policy == "true"
+                if _cacheable(res):
+                    self.placements.put(wm_class, location)
+                    if location is not None:
+                        self.clear_policies.put(location, clear)
+
+            fut = batch[wm_class]
+            if not fut.done():
+                fut.set_result((location, clear))
+
+
+RESOLVER = Resolver(ASYNC_AUTO_DESK)
+
+
+class CircuitBreaker:
+    """
+    stops hooks from knocking on auto-desk's door while it's down.
+
+    closed:    requests go through, FAILURE_THRESHOLD failures in a row trips it.
+    open:      requests are skipped until the backoff runs out.
+    half-open: a single trial request is let through, success closes the breaker,
+               failure re-opens it with double the backoff.
+    """
+
+    def __init__(self, threshold=FAILURE_THRESHOLD, backoff=BACKOFF, backoff_max=BACKOFF_MAX):
+        self.threshold = threshold
+        self.base_backoff = backoff
+        self.backoff_max = backoff_max
+        self.state = "closed"
+        self.backoff = backoff
+        self.failures = 0
+        self.retry_at = 0
+        # counters for auto_desk_stats()
+        self.trips = 0
+        self.skipped = 0
+        self.total_failures = 0
+
+    def allow(self):
+        match self.state:
+            case "closed":
+                return True
+            case "open" if time.monotonic() >= self.retry_at:
+                self.state = "half-open"
+                return True
+
+        self.skipped += 1
+        return False
+
+    def record(self, ok):
+        if ok:
+            if self.state != "closed":
+                logger.info("auto-desk is back, resuming lookups")
+            self.reset()
+            return
+
+        self.failures += 1
+        self.total_failures += 1
+        if self.state == "half-open":
+            self.backoff = min(self.backoff * 2, self.backoff_max)
+            self._trip()
+        elif self.state == "closed" and self.failures >= self.threshold:
+            self._trip()
+
+    def abandon(self):
+        """the request allow() let through ended without an answer either way"""
+        if self.state == "half-open":
+            # the trial never finished, let the next request be one.
+            self.state = "open"
+            self.retry_at = time.monotonic()
+
+    def reset(self):
+        self.state = "closed"
+        self.failures = 0
+        self.backoff = self.base_backoff
+
+    def _trip(self):
+        if self.state == "closed":
+            logger.warning(f"auto-desk looks down, skipping lookups for {self.backoff}s")
+        self.state = "open"
+        self.trips += 1
+        self.retry_at = time.monotonic() + self.backoff
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "total_failures": self.total_failures,
+            "trips": self.trips,
+            "skipped": self.skipped,
+            "retry_in": max(0, self.retry_at - time.monotonic()) if self.state == "open" else 0,
+        }
+
+
+BREAKER = CircuitBreaker()
+
+
+class SocketWatch:
+    """
+    watches the directory holding auto-desk's socket with inotify and calls
+    `callback` as soon as the socket is (re)created, so a restarted auto-desk
+    doesn't have to wait out the breaker's backoff.
+    """
+
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    EVENT = struct.Struct("iIII")  # wd, mask, cookie, len, then len bytes of name
+
+    def __init__(self, path, callback):
+        self.dir, self.name = os.path.split(path)
+        self.callback = callback
+        self.fd = None
+        self.loop = None
+
+    def start(self):
+        if self.fd is not None:
+            return
+
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if fd < 0:
+            logger.warning(f"inotify_init1 failed: {os.strerror(ctypes.get_errno())}")
+            return
+
+        if libc.inotify_add_watch(fd, os.fsencode(self.dir), self.IN_CREATE | self.IN_MOVED_TO) < 0:
+            logger.warning(f"can't watch '{self.dir}': {os.strerror(ctypes.get_errno())}")
+            os.close(fd)
+            return
+
+        self.fd = fd
+        self.loop = asyncio.get_running_loop()
+        self.loop.add_reader(fd, self._read)
+
+    def stop(self):
+        if self.fd is not None:
+            self.loop.remove_reader(self.fd)
+            os.close(self.fd)
+            self.fd = None
+
+    def _read(self):
+        try:
+            data = os.read(self.fd, 4096)
+        except BlockingIOError:
+            return
+
+        offset = 0
+        while offset < len(data):
+            _, _, _, length = self.EVENT.unpack_from(data, offset)
+            offset += self.EVENT.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if os.fsdecode(name) == self.name:
+                self.callback()
+
+
+def _auto_desk_appeared():
+    logger.info("auto-desk socket (re)created")
+    BREAKER.reset()
+
+
+SOCKET_WATCH = SocketWatch(PATH, _auto_desk_appeared)
+
+
+def auto_desk_stats():
+    """returns the circuit breaker state and counters (how many lookups were skipped, etc)"""
+    return BREAKER.stats()
+
+
+def subscribe_auto_desk():
+    """starts listening for cache invalidations from auto-desk"""
+    SOCKET_WATCH.start()
+    if FRAMED:
+        SUBSCRIBER.start()
+
+
+@hook.subscribe.shutdown
+def close_auto_desk():
+    """closes the pooled auto-desk connections"""
+    AUTO_DESK.close()
+    ASYNC_AUTO_DESK.close()
+    SUBSCRIBER.stop()
+    SOCKET_WATCH.stop()
+
+
 def clear_desktop(group):
-    """clears all desktop in self.clears"""
-    # for group in tmp_clears:
+    """moves every window in the group named `group` to the hidden group"""
     if group:
-        # windows = [w["id"]
-                # for w in QTILE_CLIENT.windows() if w["group"] == group]
-        windows = QTILE_CLIENT.group[group].windows()
         logger.info(f"about to clear windows from group '{group}'")
-        for wid in windows:
-            QTILE_CLIENT.window[wid].togroup("hidden")
-        logger.info(f"cleared group '{group}'")
+        moved = clear_windows(qtile.groups_map[group])
+        logger.info(f"cleared {moved} windows from group '{group}'")
     else:
         logger.info(f"not clearing group '{group}'")            
 
 
-def move_window(c):
+def clear_windows(group, keep=(), to="hidden"):
+    """
+    moves every window in `group` except the ones in `keep` to the group named `to`,
+    in-process and with a single relayout of each group at the end.
+    returns the number of windows moved.
+    """
+    target = group.qtile.groups_map[to]
+    if target is group:
+        return 0
+
+    keep = set(map(id, keep))
+    windows = [w for w in group.windows if id(w) not in keep]
+    if not windows:
+        return 0
+
+    with _deferred_layout(group, target):
+        for w in windows:
+            w.togroup(to)
+
+    return len(windows)
+
+
+@contextmanager
+def _deferred_layout(*groups):
+    """
+    every window moved out of (or into) a visible group normally relayouts it.
+    inside this block those relayouts are only noted, and each group that asked
+    for one gets a single layout_all() on the way out.
+    """
+    pending = {}
+
+    for group in groups:
+        def note(*args, _group=group, **kwargs):
+            pending[id(_group)] = (_group, args, kwargs)
+        group.layout_all = note
+
+    try:
+        yield
+    finally:
+        for group in groups:
+            # drop the instance attribute so the class' layout_all shows through again.
+            del group.layout_all
+        for group, args, kwargs in pending.values():
+            group.layout_all(*args, **kwargs)
+
+
+async def move_window(c):
+    """moves a window to its auto-desk group, returns False if it has no WM_CLASS yet"""
     wm_class = c.get_wm_class()
-    location = get_location(wm_class)
+    if not wm_class or len(wm_class) < 2:
+        return False
+
+    # also primes the clear policy cache for clear_group().
+    location, _ = await resolve(wm_class)
     logger.debug(f"moving to location, '{location}'")
-    # clear = should_clear(location)
-    # if clear:
-    #     clear_desktop(location)
     if location:
         c.togroup(location)
+
+    return True
+
+
+# running inside qtile (first load or a reload) there's always a running loop.
+# imported on its own, eg. by bench/, whoever imported it starts what it needs.
+try:
+    asyncio.get_running_loop()
+except RuntimeError:
+    pass
+else:
+    subscribe_auto_desk()
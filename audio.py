@@ -0,0 +1,300 @@
+######################################
+# Volume and media key handling      #
+######################################
+
+# volume keys used to fork `bash ~/.config/system_scripts/volume ...` with
+# os.system, blocking the loop once per key repeat. here presses only add to a
+# pending change, which is applied with a single `pactl` (run async) once per
+# FRAME, however many repeats came in. the volume widget is pushed the new
+# level right away and kept in sync by a long-lived `pactl subscribe`, so it
+# never polls. media keys go straight to the MPRIS player over the shared
+# session bus connection (bus.py).
+
+
+from libqtile.log_utils import logger
+from libqtile.widget import base
+from libqtile import hook, qtile
+from dbus_next.errors import DBusError
+import asyncio
+import re
+from bus import get_bus, run_soon
+
+
+# qtile runs this module again on a config reload (same globals), without the
+# shutdown hook. stop the old AUDIO first or its `pactl subscribe` lives on.
+if "stop_audio" in globals():
+    stop_audio()
+
+
+SINK = "@DEFAULT_SINK@"
+VOLUME_STEP = 5  # percent per key press
+MAX_VOLUME = 100
+# key repeats within one frame are applied together.
+FRAME = 1 / 60
+RESUBSCRIBE_DELAY = 5
+MPRIS_PREFIX = "org.mpris.MediaPlayer2."
+MPRIS_PATH = "/org/mpris/MediaPlayer2"
+PLAYER_INTERFACE = "org.mpris.MediaPlayer2.Player"
+MPRIS_INTROSPECTION = """
+<node>
+  <interface name="org.mpris.MediaPlayer2.Player">
+    <method name="PlayPause"/>
+    <method name="Next"/>
+    <method name="Previous"/>
+    <property name="PlaybackStatus" type="s" access="read"/>
+  </interface>
+</node>
+"""
+DBUS_INTROSPECTION = """
+<node>
+  <interface name="org.freedesktop.DBus">
+    <method name="ListNames">
+      <arg type="as" name="names" direction="out"/>
+    </method>
+  </interface>
+</node>
+"""
+VOLUME_RE = re.compile(r"(\d+)%")
+
+
+async def pactl(*args):
+    """runs pactl without blocking the loop, returns (exit code, stdout)"""
+    proc = await asyncio.create_subprocess_exec(
+        "pactl", *args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL
+    )
+    out, _ = await proc.communicate()
+    return proc.returncode, out.decode("utf-8", errors="replace")
+
+
+class AudioController:
+    def __init__(self, sink=SINK):
+        self.sink = sink
+        self.volume = None  # percent, None until it's been read
+        self.muted = False
+        self.listeners = []
+        # key presses not applied yet
+        self.pending = 0
+        self.pending_mute = False
+        self.flush_timer = None
+        self.applying = False
+        self.refresh_timer = None
+        self.subscriber = None  # the `pactl subscribe` process
+        self.subscribe_task = None
+        # counters for stats()
+        self.presses = 0
+        self.changes = 0
+
+    def start(self):
+        if self.subscribe_task is None:
+            self.subscribe_task = run_soon(self._subscribe())
+
+    def stop(self):
+        if self.subscribe_task is not None:
+            self.subscribe_task.cancel()
+            self.subscribe_task = None
+        if self.subscriber is not None and self.subscriber.returncode is None:
+            self.subscriber.terminate()
+        self.subscriber = None
+
+    def subscribe(self, callback):
+        """callback(volume, muted) is called on every change, right away if the volume is known"""
+        self.listeners.append(callback)
+        if self.volume is not None:
+            callback(self.volume, self.muted)
+
+    def unsubscribe(self, callback):
+        if callback in self.listeners:
+            self.listeners.remove(callback)
+
+    def _notify(self):
+        for callback in list(self.listeners):
+            try:
+                callback(self.volume, self.muted)
+            except Exception as e:
+                logger.error(f"volume listener {callback!r} failed: {e!r}")
+
+    ########################
+    # volume / mute keys   #
+    ########################
+
+    def volume_up(self, step=VOLUME_STEP):
+        self._press(step)
+
+    def volume_down(self, step=VOLUME_STEP):
+        self._press(-step)
+
+    def toggle_mute(self):
+        self._press(0, mute=True)
+
+    def _press(self, delta, mute=False):
+        self.presses += 1
+        self.pending += delta
+        if mute:
+            self.pending_mute = not self.pending_mute
+        if self.volume is not None:
+            # show the change now, pactl catches up within a frame.
+            self.volume = min(max(self.volume + delta, 0), MAX_VOLUME)
+            self.muted = self.muted != mute
+            self._notify()
+        if self.flush_timer is None and not self.applying:
+            self.flush_timer = qtile.call_later(FRAME, self._flush)
+
+    def _flush(self):
+        self.flush_timer = None
+        run_soon(self._apply())
+
+    async def _apply(self):
+        """applies every press since the last frame, then any that came in while it ran"""
+        self.applying = True
+        try:
+            while self.pending or self.pending_mute:
+                delta, self.pending = self.pending, 0
+                mute, self.pending_mute = self.pending_mute, False
+
+                if mute:
+                    await pactl("set-sink-mute", self.sink, "toggle")
+                if delta:
+                    if self.volume is not None:
+                        # absolute, so repeats can't push it past MAX_VOLUME.
+                        await pactl("set-sink-volume", self.sink, f"{self.volume}%")
+                    else:
+                        await pactl("set-sink-volume", self.sink, f"{delta:+d}%")
+                self.changes += 1
+        except OSError as e:
+            logger.error(f"couldn't run pactl: {e!r}")
+        finally:
+            self.applying = False
+
+    ########################
+    # keeping in sync      #
+    ########################
+
+    async def refresh(self):
+        """reads the sink's volume and mute state"""
+        (_, volume), (_, mute) = await asyncio.gather(
+            pactl("get-sink-volume", self.sink), pactl("get-sink-mute", self.sink)
+        )
+        if self.pending or self.pending_mute or self.applying:
+            return  # stale, the change we're making will send another event
+        match = VOLUME_RE.search(volume)
+        if match is None:
+            return
+        volume, muted = int(match.group(1)), "yes" in mute
+        if (volume, muted) != (self.volume, self.muted):
+            self.volume, self.muted = volume, muted
+            self._notify()
+
+    def _refresh_soon(self):
+        # a volume change is reported once per channel/stream, one read covers them all.
+        if self.refresh_timer is None:
+            self.refresh_timer = qtile.call_later(FRAME, self._refresh_now)
+
+    def _refresh_now(self):
+        self.refresh_timer = None
+        run_soon(self.refresh())
+
+    async def _subscribe(self):
+        """follows `pactl subscribe`, restarting it if it exits"""
+        while True:
+            try:
+                await self.refresh()
+                self.subscriber = await asyncio.create_subprocess_exec(
+                    "pactl", "subscribe", stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL
+                )
+                async for line in self.subscriber.stdout:
+                    # eg. "Event 'change' on sink #56", "Event 'change' on server #-1" (default sink changed)
+                    if b" on sink " in line or b" on server" in line:
+                        self._refresh_soon()
+                await self.subscriber.wait()
+            except OSError as e:
+                logger.error(f"couldn't follow pactl subscribe: {e!r}")
+            await asyncio.sleep(RESUBSCRIBE_DELAY)
+
+    def stats(self):
+        return {"presses": self.presses, "changes": self.changes, "volume": self.volume, "muted": self.muted}
+
+
+AUDIO = AudioController()
+
+
+########################
+# media keys (MPRIS)   #
+########################
+
+
+async def _player():
+    """the MPRIS player interface of the playing player (or any if none are playing), None if there's none"""
+    bus = await get_bus()
+    dbus = bus.get_proxy_object("org.freedesktop.DBus", "/org/freedesktop/DBus", DBUS_INTROSPECTION)
+    names = [name for name in await dbus.get_interface("org.freedesktop.DBus").call_list_names()
+             if name.startswith(MPRIS_PREFIX)]
+
+    fallback = None
+    for name in names:
+        player = bus.get_proxy_object(name, MPRIS_PATH, MPRIS_INTROSPECTION).get_interface(PLAYER_INTERFACE)
+        try:
+            if await player.get_playback_status() == "Playing":
+                return player
+        except DBusError:
+            continue
+        fallback = fallback or player
+    return fallback
+
+
+async def media(action):
+    """sends "play_pause", "next" or "previous" to the current MPRIS player"""
+    try:
+        player = await _player()
+        if player is not None:
+            await getattr(player, f"call_{action}")()
+    except (DBusError, OSError) as e:
+        logger.warning(f"media key {action} failed: {e!r}")
+
+
+def media_key(action):
+    """media() for lazy.function/key bindings"""
+    return lambda qtile: run_soon(media(action))
+
+
+class VolumeWidget(base._TextBox):
+    """volume text for the bar, pushed by the AudioController instead of polled"""
+
+    defaults = [
+        ("mute_format", "M", "text when muted"),
+        ("controller", None, "the AudioController to show, defaults to audio.AUDIO"),
+    ]
+
+    def __init__(self, **config):
+        base._TextBox.__init__(self, "", **config)
+        self.add_defaults(VolumeWidget.defaults)
+        self.controller = self.controller or AUDIO
+
+    def _configure(self, qtile, bar):
+        base._TextBox._configure(self, qtile, bar)
+        self.controller.subscribe(self._changed)
+        self.controller.start()
+
+    def _changed(self, volume, muted):
+        self.update(self.mute_format if muted else f"{volume}%")
+
+    def finalize(self):
+        self.controller.unsubscribe(self._changed)
+        base._TextBox.finalize(self)
+
+
+def start_audio():
+    AUDIO.start()
+
+
+@hook.subscribe.shutdown
+def stop_audio():
+    AUDIO.stop()
+
+
+# under qtile the loop is already running, on the first load as on a reload.
+try:
+    asyncio.get_running_loop()
+except RuntimeError:
+    pass
+else:
+    start_audio()
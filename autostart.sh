@@ -64,6 +64,9 @@ systemctl start --user auto-desk.service &
 systemctl restart --user greenclip &
 xss-lock -- betterlockscreen -l -q > /dev/null &
 mkdir -p /tmp/qtile/ & 
+# the one writer of the function log, see logger.Logger(sink=...). rotates at 8MB
+# or once a week, keeping the last 5 gzipped segments.
+python ~/.config/qtile/logsink.py --max-bytes 8388608 --max-age 604800 --backups 5 &
 python -m frankentile.web 10.42.69.3 & 
 python -m frankentile.discord_bot &
 doas nebula -config /etc/nebula/config.yml &
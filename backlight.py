@@ -0,0 +1,205 @@
+######################################
+# Screen brightness                  #
+######################################
+
+# the brightness keys used to fork `bash ~/.config/system_scripts/brightness`
+# with os.system. here a key press only moves the target level, a timer then
+# fades the panel towards it one frame at a time, so key repeats collapse into
+# at most one write per frame and nothing blocks the loop.
+#
+# levels are read from /sys/class/backlight (ROOT, point it at a fake tree to
+# try this out without the hardware, see bench/check_backlight.py) and written through logind's
+# SetBrightness, which needs no extra permissions. if logind refuses, the
+# brightness file is written directly (needs a udev rule making it writable).
+
+
+from libqtile.log_utils import logger
+from dbus_next import BusType
+from dbus_next.errors import DBusError
+import asyncio
+import math
+import os
+import time
+from bus import get_bus, run_soon
+
+
+
+ROOT = "/sys/class/backlight"
+STEP = 5  # percent per key press
+FADE = 0.15  # seconds a key press takes to fade to its new level
+FRAME = 1 / 60
+# which device to use when there's several, per the kernel's docs firmware
+# controls are preferred over platform ones over raw register access.
+TYPE_PREFERENCE = ["firmware", "platform", "raw"]
+LOGIN1 = "org.freedesktop.login1"
+SESSION_PATH = "/org/freedesktop/login1/session/auto"
+SESSION_INTERFACE = "org.freedesktop.login1.Session"
+INTROSPECTION = """
+<node>
+  <interface name="org.freedesktop.login1.Session">
+    <method name="SetBrightness">
+      <arg type="s" name="subsystem" direction="in"/>
+      <arg type="s" name="name" direction="in"/>
+      <arg type="u" name="brightness" direction="in"/>
+    </method>
+  </interface>
+</node>
+"""
+
+
+def find_device(root=ROOT):
+    """the name of the backlight device under root to use, None if there's none"""
+    try:
+        names = sorted(os.listdir(root))
+    except OSError:
+        return None
+
+    def rank(name):
+        try:
+            with open(os.path.join(root, name, "type")) as f:
+                kind = f.read().strip()
+        except OSError:
+            kind = None
+        return TYPE_PREFERENCE.index(kind) if kind in TYPE_PREFERENCE else len(TYPE_PREFERENCE)
+
+    return min(names, key=rank, default=None)
+
+
+class Backlight:
+    def __init__(self, root=ROOT, device=None, use_logind=True):
+        self.root = root
+        self.device = device
+        self.use_logind = use_logind
+        self.max = None
+        self.level = None  # raw level last written (or read)
+        self.target = None  # raw level being faded to
+        self.fade_end = None
+        self.timer = None
+        self.writing = False  # a logind call is in flight
+        self.session = None
+        # counters for stats()
+        self.presses = 0
+        self.writes = 0
+
+    def _path(self, name):
+        return os.path.join(self.root, self.device, name)
+
+    def _read(self, name):
+        with open(self._path(name)) as f:
+            return int(f.read().strip())
+
+    def _ensure_device(self):
+        if self.device is None:
+            self.device = find_device(self.root)
+            if self.device is None:
+                return False
+        if self.max is None:
+            self.max = self._read("max_brightness")
+        return True
+
+    def percent(self):
+        """the current brightness in percent"""
+        if not self._ensure_device():
+            return None
+        level = self.level if self.level is not None else self._read("brightness")
+        return round(level * 100 / self.max)
+
+    ########################
+    # changing it          #
+    ########################
+
+    def up(self, step=STEP):
+        self.move(step)
+
+    def down(self, step=STEP):
+        self.move(-step)
+
+    def move(self, step):
+        """moves the target by `step` percent, from wherever the last press left it"""
+        self.presses += 1
+        if not self._ensure_device():
+            return
+        if self.timer is None:
+            # nothing fading, start from the panel's real level (something else may have changed it).
+            self.level = self.target = self._read("brightness")
+        target = round(self.target + step * self.max / 100)
+        if target == self.target:
+            # steps smaller than the device's resolution still do something.
+            target += 1 if step > 0 else -1
+        self.fade_to(target * 100 / self.max)
+
+    def fade_to(self, percent, duration=FADE):
+        """fades to `percent` over `duration` seconds (0 for right away), retargeting any fade in progress"""
+        if not self._ensure_device():
+            return
+        # never all the way to off.
+        self.target = min(max(round(percent * self.max / 100), 1), self.max)
+        if self.level is None:
+            self.level = self._read("brightness")
+        self.fade_end = time.monotonic() + duration
+        if self.timer is None:
+            self._tick()
+
+    def _tick(self):
+        self.timer = None
+        remaining = self.target - self.level
+        if remaining == 0:
+            return
+
+        left = self.fade_end - time.monotonic()
+        if left <= FRAME:
+            level = self.target
+        else:
+            # an even share of what's left for each remaining frame, at least one step.
+            share = remaining * FRAME / left
+            level = self.level + (math.ceil(share) if share > 0 else math.floor(share))
+        self._write(level)
+
+        if level != self.target:
+            self.timer = asyncio.get_running_loop().call_later(FRAME, self._tick)
+
+    ########################
+    # writing it           #
+    ########################
+
+    def _write(self, level):
+        self.level = level
+        if not self.use_logind:
+            self._write_sysfs(level)
+        elif not self.writing:
+            run_soon(self._write_logind())
+        # else the call in flight picks up self.level when it's done.
+
+    def _write_sysfs(self, level):
+        try:
+            with open(self._path("brightness"), "w") as f:
+                f.write(str(level))
+            self.writes += 1
+        except OSError as e:
+            logger.error(f"couldn't set the brightness of {self.device}: {e!r}")
+
+    async def _write_logind(self):
+        self.writing = True
+        try:
+            if self.session is None:
+                bus = await get_bus(BusType.SYSTEM)
+                proxy = bus.get_proxy_object(LOGIN1, SESSION_PATH, INTROSPECTION)
+                self.session = proxy.get_interface(SESSION_INTERFACE)
+            written = None
+            while written != self.level:
+                written = self.level
+                await self.session.call_set_brightness("backlight", self.device, written)
+                self.writes += 1
+        except (DBusError, OSError) as e:
+            logger.warning(f"logind SetBrightness failed ({e!r}), writing {self.device} directly")
+            self.use_logind = False
+            self._write_sysfs(self.level)
+        finally:
+            self.writing = False
+
+    def stats(self):
+        return {"device": self.device, "level": self.level, "max": self.max, "presses": self.presses,
+                "writes": self.writes, "logind": self.use_logind}
+
+
+BACKLIGHT = Backlight()
@@ -0,0 +1,255 @@
+######################################
+# Battery state from UPower signals  #
+######################################
+
+# one place that knows the battery's state. UPower's DisplayDevice (the
+# combined battery) is read once over the shared system bus connection
+# (bus.py), after that its PropertiesChanged signals keep it current, nothing
+# polls. the bar widget and bat_notif both read from BATTERY.
+#
+# time left is estimated from the energy readings of the last few minutes
+# (least squares slope), UPower's own TimeToEmpty/TimeToFull swing around with
+# every momentary change in load and are only used until there's enough history.
+
+
+from libqtile.log_utils import logger
+from libqtile.widget import base
+from libqtile import hook
+from dbus_next import BusType
+from dbus_next.errors import DBusError
+from collections import deque
+import asyncio
+import time
+from bus import get_bus, run_soon
+
+
+# on a config reload qtile runs this module again (same globals) and skips the
+# shutdown hook, stop the old BATTERY so it lets go of its PropertiesChanged match.
+if "stop_battery" in globals():
+    stop_battery()
+
+
+UPOWER = "org.freedesktop.UPower"
+DISPLAY_DEVICE = "/org/freedesktop/UPower/devices/DisplayDevice"
+DEVICE_INTERFACE = "org.freedesktop.UPower.Device"
+PROPERTIES_INTERFACE = "org.freedesktop.DBus.Properties"
+INTROSPECTION = """
+<node>
+  <interface name="org.freedesktop.DBus.Properties">
+    <method name="GetAll">
+      <arg type="s" name="interface_name" direction="in"/>
+      <arg type="a{sv}" name="properties" direction="out"/>
+    </method>
+    <signal name="PropertiesChanged">
+      <arg type="s" name="interface_name"/>
+      <arg type="a{sv}" name="changed_properties"/>
+      <arg type="as" name="invalidated_properties"/>
+    </signal>
+  </interface>
+</node>
+"""
+# UPower device states
+UNKNOWN, CHARGING, DISCHARGING, EMPTY, FULL, PENDING_CHARGE, PENDING_DISCHARGE = range(7)
+# energy readings older than this (seconds) don't count towards the time left estimate,
+HISTORY = 10 * 60
+HISTORY_SIZE = 64
+# and they have to span at least this long before it's trusted over UPower's.
+MIN_SPAN = 2 * 60
+RETRY = 5  # seconds before reconnecting to UPower after a failure, doubled each time
+RETRY_MAX = 5 * 60
+
+
+class BatteryState:
+    """what the battery was doing as of `updated` (time.monotonic())"""
+
+    __slots__ = ("percent", "state", "energy", "energy_full", "energy_rate", "time_left", "updated")
+
+    def __init__(self, percent=0.0, state=UNKNOWN, energy=0.0, energy_full=0.0, energy_rate=0.0, time_left=None):
+        self.percent = percent  # 0 - 100
+        self.state = state
+        self.energy = energy  # Wh
+        self.energy_full = energy_full
+        self.energy_rate = energy_rate  # W
+        self.time_left = time_left  # seconds until empty (or full when charging), None if unknown
+        self.updated = time.monotonic()
+
+    @property
+    def charging(self):
+        return self.state in (CHARGING, FULL, PENDING_CHARGE)
+
+    def format_args(self):
+        """the fields libqtile's widget.Battery formats, so the same format strings work"""
+        char = {CHARGING: "^", DISCHARGING: "V", FULL: "=", EMPTY: "x"}.get(self.state, "?")
+        hours, minutes = divmod((self.time_left or 0) // 60, 60)
+        return {
+            "char": char,
+            "percent": self.percent / 100,
+            "watt": self.energy_rate,
+            "hour": int(hours),
+            "min": int(minutes),
+        }
+
+
+class BatteryService:
+    def __init__(self):
+        self.state = None
+        self.listeners = []
+        self.history = deque(maxlen=HISTORY_SIZE)  # (time.monotonic(), Wh or %) since the last state change
+        self.properties = {}
+        self.interface = None
+        self.ready = None  # an asyncio.Event once started
+        self.retry = None  # timer for the next _connect after a failed one
+        self.backoff = RETRY
+
+    def start(self):
+        """connects to UPower, safe to call more than once"""
+        if self.ready is None:
+            self.ready = asyncio.Event()
+            run_soon(self._connect())
+
+    def stop(self):
+        if self.retry is not None:
+            self.retry.cancel()
+            self.retry = None
+        self._disconnect()
+        self.ready = None
+
+    def _disconnect(self):
+        if self.interface is not None:
+            self.interface.off_properties_changed(self._changed)
+            self.interface = None
+
+    def subscribe(self, callback):
+        """callback(state) is called on every change, right away if the state is already known"""
+        self.listeners.append(callback)
+        if self.state is not None:
+            callback(self.state)
+
+    def unsubscribe(self, callback):
+        if callback in self.listeners:
+            self.listeners.remove(callback)
+
+    async def current(self):
+        """the latest BatteryState, waits for the first reading if there hasn't been one yet"""
+        self.start()
+        if self.state is None:
+            await self.ready.wait()
+        return self.state
+
+    async def _connect(self):
+        try:
+            bus = await get_bus(BusType.SYSTEM)
+            proxy = bus.get_proxy_object(UPOWER, DISPLAY_DEVICE, INTROSPECTION)
+            interface = proxy.get_interface(PROPERTIES_INTERFACE)
+            interface.on_properties_changed(self._changed)
+            self.interface = interface
+            self._update(await interface.call_get_all(DEVICE_INTERFACE))
+        except (DBusError, OSError) as e:
+            logger.error(f"couldn't read the battery from UPower ({e!r}), retrying in {self.backoff}s")
+            self._disconnect()
+            # don't leave current() callers waiting until it's back.
+            self.state = self.state or BatteryState()
+            self.ready.set()
+            self.retry = asyncio.get_running_loop().call_later(self.backoff, self._reconnect)
+            self.backoff = min(self.backoff * 2, RETRY_MAX)
+        else:
+            self.backoff = RETRY
+
+    def _reconnect(self):
+        self.retry = None
+        if self.ready is not None:  # not stopped in the meantime
+            run_soon(self._connect())
+
+    def _changed(self, interface, changed, invalidated):
+        if interface == DEVICE_INTERFACE:
+            self._update(changed)
+
+    def _update(self, changed):
+        previous = self.properties.get("State")
+        self.properties.update({name: variant.value for name, variant in changed.items()})
+        props = self.properties
+
+        now = time.monotonic()
+        state = props.get("State", UNKNOWN)
+        if state != previous:
+            self.history.clear()
+        if "Energy" in changed or "Percentage" in changed:
+            self.history.append((now, props.get("Energy") or props.get("Percentage", 0.0)))
+
+        self.state = BatteryState(
+            percent=props.get("Percentage", 0.0),
+            state=state,
+            energy=props.get("Energy", 0.0),
+            energy_full=props.get("EnergyFull", 0.0),
+            energy_rate=props.get("EnergyRate", 0.0),
+            time_left=self._time_left(state, props),
+        )
+        self.ready.set()
+
+        for callback in list(self.listeners):
+            try:
+                callback(self.state)
+            except Exception as e:
+                logger.error(f"battery listener {callback!r} failed: {e!r}")
+
+    def _time_left(self, state, props):
+        """seconds until empty (full when charging) from the recent history, UPower's guess until there's enough"""
+        upower = props.get("TimeToFull") if state == CHARGING else props.get("TimeToEmpty")
+        upower = upower or None
+
+        now = time.monotonic()
+        samples = [(t, v) for t, v in self.history if now - t <= HISTORY]
+        if len(samples) < 2 or samples[-1][0] - samples[0][0] < MIN_SPAN:
+            return upower
+
+        # least squares slope of the samples, in units (Wh or %) per second.
+        mean_t = sum(t for t, _ in samples) / len(samples)
+        mean_v = sum(v for _, v in samples) / len(samples)
+        var = sum((t - mean_t) ** 2 for t, _ in samples)
+        slope = sum((t - mean_t) * (v - mean_v) for t, v in samples) / var
+        current = samples[-1][1]
+
+        if state == DISCHARGING and slope < 0:
+            return int(current / -slope)
+        if state == CHARGING and slope > 0:
+            full = props.get("EnergyFull") if props.get("Energy") else 100.0
+            return int(max(full - current, 0) / slope)
+        return upower
+
+
+BATTERY = BatteryService()
+
+
+class BatteryWidget(base._TextBox):
+    """
+    battery text for the bar, redrawn when UPower says something changed
+    instead of on a timer. takes widget.Battery's format fields
+    (char, percent, watt, hour, min).
+    """
+
+    defaults = [
+        ("format", "{char} {percent:2.0%} {hour:d}:{min:02d}", "display format"),
+        ("service", None, "the BatteryService to show, defaults to battery.BATTERY"),
+    ]
+
+    def __init__(self, **config):
+        base._TextBox.__init__(self, "", **config)
+        self.add_defaults(BatteryWidget.defaults)
+        self.service = self.service or BATTERY
+
+    def _configure(self, qtile, bar):
+        base._TextBox._configure(self, qtile, bar)
+        self.service.subscribe(self._changed)
+        self.service.start()
+
+    def _changed(self, state):
+        self.update(self.format.format(**state.format_args()))
+
+    def finalize(self):
+        self.service.unsubscribe(self._changed)
+        base._TextBox.finalize(self)
+
+
+@hook.subscribe.shutdown
+def stop_battery():
+    BATTERY.stop()
@@ -0,0 +1,68 @@
+"""
+bench_clear.py
+
+benchmarks api.clear_windows (bulk, one relayout) against the old
+one togroup() per window loop on groups of 50+ windows.
+
+the groups and windows are the stand-ins from fakes.py: every remove/add
+on a visible group calls layout_all(), which costs RELAYOUT_COST seconds
+per window in the group.
+
+usage: python bench/bench_clear.py [n windows ...]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import api  # noqa: E402
+from fakes import FakeQtile, FakeWindow  # noqa: E402
+
+
+ROUNDS = 5
+
+
+def make_group(n):
+    group = FakeQtile(["1", "hidden"]).groups_map["1"]
+    for wid in range(n):
+        group.add(FakeWindow(wid, 1000 + wid))
+    group.relayouts = 0
+    return group
+
+
+def old_clear(group, window):
+    pid = window.get_pid()
+    for w in list(group.windows):
+        if w.get_pid() != pid:
+            w.togroup("hidden")
+
+
+def new_clear(group, window):
+    pid = api._pid(window)
+    api.clear_windows(group, [w for w in group.windows if api._pid(w) == pid])
+
+
+def bench(clear, n):
+    best = float("inf")
+    for _ in range(ROUNDS):
+        api.PIDS.clear()
+        group = make_group(n)
+        start = time.perf_counter()
+        clear(group, group.windows[-1])
+        best = min(best, time.perf_counter() - start)
+        assert len(group.windows) == 1
+    return best, group.relayouts
+
+
+def main(sizes):
+    print(f"{'windows':>8} {'old ms':>9} {'relayouts':>10} {'bulk ms':>9} {'relayouts':>10}")
+    for n in sizes:
+        old_t, old_r = bench(old_clear, n)
+        new_t, new_r = bench(new_clear, n)
+        print(f"{n:>8} {old_t * 1000:>9.2f} {old_r:>10} {new_t * 1000:>9.2f} {new_r:>10}")
+
+
+if __name__ == "__main__":
+    main([int(n) for n in sys.argv[1:]] or [50, 100, 200])
@@ -0,0 +1,152 @@
+"""
+bench_hooks.py
+
+window open latency benchmark for api.py's hooks.
+
+starts bench/fake_auto_desk.py (any extra arguments after -- are passed to it),
+points api.py at it and opens synthetic windows at --rate windows/sec. each one
+goes through open_on (client_new), open_on_backup (client_managed) and
+clear_group, and move_window is timed on its own. reports p50/p99/max per hook.
+
+usage:
+    python bench/bench_hooks.py --rate 50 --windows 500
+    python bench/bench_hooks.py --no-rules --classes 1000 -- --latency 2 --jitter 5
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import api  # noqa: E402
+from fakes import FakeQtile, FakeWindow  # noqa: E402
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SOCKET = "/tmp/fake-auto-desk-bench"
+
+
+def point_at(path):
+    """makes every auto-desk client in api.py use `path`"""
+    api.PATH = path
+    api.AUTO_DESK.path = path
+    api.ASYNC_AUTO_DESK.path = path
+    api.SUBSCRIBER.path = path
+
+
+def percentile(samples, p):
+    if not samples:
+        return float("nan")
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+
+    async def time(self, name, coro):
+        start = time.perf_counter()
+        res = await coro
+        self.samples.setdefault(name, []).append(time.perf_counter() - start)
+        return res
+
+    def report(self):
+        print(f"{'hook':<16} {'n':>6} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+        for name, samples in self.samples.items():
+            print(f"{name:<16} {len(samples):>6} {percentile(samples, .5) * 1000:>9.3f} "
+                  f"{percentile(samples, .99) * 1000:>9.3f} {max(samples) * 1000:>9.3f}")
+
+
+async def open_window(qtile, recorder, wid, classes):
+    n = wid % classes
+    window = FakeWindow(wid, 10000 + wid, (f"app{n}", f"App{n}"))
+    qtile.groups_map["1"].add(window)
+
+    await recorder.time("open_on", api.open_on(window))
+    await recorder.time("open_on_backup", api.open_on_backup(window))
+    await recorder.time("clear_group", api.clear_group(window.group, window))
+    await recorder.time("move_window", api.move_window(window))
+
+
+async def run(args):
+    point_at(SOCKET)
+    api.LOCAL_RULES = not args.no_rules
+    api.BATCHED = not args.no_batch
+    if args.no_cache:
+        api.PLACEMENTS.ttl = api.CLEAR_POLICIES.ttl = 0
+
+    if api.FRAMED:
+        api.SUBSCRIBER.start()
+        if api.LOCAL_RULES:
+            for _ in range(100):
+                if api.RULES.synced:
+                    break
+                await asyncio.sleep(0.01)
+            print(f"local rules synced: {api.RULES.synced}")
+
+    qtile = FakeQtile(["hidden"] + [str(g) for g in range(1, 11)])
+    recorder = Recorder()
+    tasks = []
+    interval = 1 / args.rate
+    start = time.perf_counter()
+
+    for wid in range(args.windows):
+        # keep to the schedule even if a hook ran long.
+        await asyncio.sleep(max(0, start + wid * interval - time.perf_counter()))
+        tasks.append(asyncio.create_task(open_window(qtile, recorder, wid, args.classes)))
+
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+
+    api.SUBSCRIBER.stop()
+    api.ASYNC_AUTO_DESK.close()
+
+    print(f"{args.windows} windows in {elapsed:.2f}s ({args.windows / elapsed:.1f}/s)")
+    recorder.report()
+    print(f"auto-desk: {api.auto_desk_stats()}")
+
+
+def main():
+    argv = sys.argv[1:]
+    server_args = []
+    if "--" in argv:
+        split = argv.index("--")
+        argv, server_args = argv[:split], argv[split + 1:]
+
+    parser = argparse.ArgumentParser(description="benchmark api.py's window hooks")
+    parser.add_argument("--rate", type=float, default=50, help="windows opened per second")
+    parser.add_argument("--windows", type=int, default=500)
+    parser.add_argument("--classes", type=int, default=20, help="distinct WM_CLASSes to cycle through")
+    parser.add_argument("--no-rules", action="store_true", help="don't use the local rules engine")
+    parser.add_argument("--no-batch", action="store_true", help="separate auto-move/should-clear lookups")
+    parser.add_argument("--no-cache", action="store_true", help="don't cache placements/clear policies")
+    parser.add_argument("--oneshot", action="store_true", help="use the old one connection per message protocol")
+    args = parser.parse_args(argv)
+
+    if args.oneshot:
+        api.FRAMED = False
+        server_args.append("--oneshot")
+    if os.path.exists(SOCKET):
+        os.unlink(SOCKET)
+
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(HERE, "fake_auto_desk.py"), "--path", SOCKET] + server_args
+    )
+    try:
+        for _ in range(100):
+            if os.path.exists(SOCKET):
+                break
+            time.sleep(0.01)
+        asyncio.run(run(args))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+check_backlight.py
+
+runs backlight.py's fades against a fake /sys/class/backlight tree, no panel,
+logind or qtile needed. checks which device is picked, that mashed keys fade
+to the right level in at most one write per frame, and that levels stay
+within 1..max_brightness. prints key presses vs. writes for each case.
+
+usage: python bench/check_backlight.py [--keep DIR]
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import backlight  # noqa: E402
+
+
+# name -> (type, max_brightness, brightness)
+DEVICES = {
+    "acpi_video0": ("firmware", 100, 50),
+    "intel_backlight": ("raw", 7, 3),
+}
+
+
+def make_tree(root):
+    for name, (kind, max_level, level) in DEVICES.items():
+        os.makedirs(os.path.join(root, name))
+        for file, value in (("type", kind), ("max_brightness", max_level), ("brightness", level)):
+            with open(os.path.join(root, name, file), "w") as f:
+                f.write(f"{value}\n")
+
+
+def on_disk(root, name):
+    with open(os.path.join(root, name, "brightness")) as f:
+        return int(f.read().strip())
+
+
+async def settle(light):
+    """waits for the fade in progress to finish"""
+    while light.timer is not None:
+        await asyncio.sleep(backlight.FRAME)
+
+
+async def run(root):
+    failures = []
+
+    def check(what, ok, detail=""):
+        print(f"{'ok  ' if ok else 'FAIL'} {what} {detail}".rstrip())
+        if not ok:
+            failures.append(what)
+
+    check("prefers firmware over raw", backlight.find_device(root) == "acpi_video0")
+    check("no device under a missing root", backlight.find_device(os.path.join(root, "nope")) is None)
+
+    light = backlight.Backlight(root=root, use_logind=False)
+    check("reads the current level", light.percent() == 50, f"({light.percent()}%)")
+
+    # a key held down: 6 presses a frame apart, then 2 the other way mid fade.
+    for _ in range(6):
+        light.up()
+        await asyncio.sleep(backlight.FRAME)
+    for _ in range(2):
+        light.down()
+    await settle(light)
+    frames = (6 + 2) + round(backlight.FADE / backlight.FRAME) + 1
+    check("mashed keys land on the target", on_disk(root, "acpi_video0") == 70, f"({on_disk(root, 'acpi_video0')})")
+    check("at most one write per frame", light.writes <= frames, f"({light.presses} presses, {light.writes} writes)")
+
+    light.fade_to(0, 0)
+    check("never fades all the way off", on_disk(root, "acpi_video0") == 1)
+    light.fade_to(150)
+    await settle(light)
+    check("stops at max_brightness", on_disk(root, "acpi_video0") == 100)
+
+    # 1% steps are below this device's resolution, each one should still move it.
+    coarse = backlight.Backlight(root=root, device="intel_backlight", use_logind=False)
+    for _ in range(2):
+        coarse.down(1)
+        await settle(coarse)
+    check("small steps still move coarse devices", on_disk(root, "intel_backlight") == 1,
+          f"({coarse.presses} presses, {coarse.writes} writes)")
+
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="checks backlight.py against a fake sysfs tree")
+    parser.add_argument("--keep", help="build the tree in this directory and leave it there")
+    args = parser.parse_args(argv)
+
+    root = args.keep or tempfile.mkdtemp(prefix="fake-backlight-")
+    try:
+        make_tree(root)
+        failures = asyncio.run(run(root))
+    finally:
+        if not args.keep:
+            shutil.rmtree(root, ignore_errors=True)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,192 @@
+"""
+fake_auto_desk.py
+
+a local stand-in for the desktop-automater (auto-desk) service, speaking the
+same protocol api.py does: framed (or --oneshot) auto-move / should-clear /
+resolve / rules / subscribe. answers come from a generated rule table,
+windows with WM_CLASS class App<n> go to group (n % 10) + 1 and odd groups clear.
+
+latency, errors and hangs are configurable so api.py's deadlines, breaker
+and caches can be exercised without the real thing.
+
+usage: python bench/fake_auto_desk.py [--path /tmp/fake-auto-desk] [--latency 1] ...
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import struct
+
+
+HEADER = struct.Struct("!I")
+GROUPS = 10
+
+
+class FakeAutoDesk:
+    def __init__(self, rules=100, latency=0.0, jitter=0.0, error_rate=0.0, hang_rate=0.0,
+                 oneshot=False, serve_rules=True, push_every=None):
+        self.n_rules = rules
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.hang_rate = hang_rate
+        self.oneshot = oneshot
+        self.serve_rules = serve_rules
+        self.push_every = push_every
+        self.subscribers = set()
+        self.requests = 0
+
+    def location(self, instance, wm_class):
+        if wm_class.startswith("App") and wm_class[3:].isdigit() and int(wm_class[3:]) < self.n_rules:
+            return str(int(wm_class[3:]) % GROUPS + 1)
+        return None
+
+    def clears(self, group):
+        return group.isdigit() and int(group) % 2 == 1
+
+    def rule_lines(self):
+        lines = [f"move class App{i} {i % GROUPS + 1}" for i in range(self.n_rules)]
+        lines += [f"clear {g} {str(self.clears(str(g))).lower()}" for g in range(1, GROUPS + 1)]
+        return lines
+
+    def answer(self, message):
+        """returns (error code, payload) for a request"""
+        match message.split("\n")[0].split():
+            case ["auto-move", instance, wm_class]:
+                return 0, self.location(instance, wm_class) or ""
+            case ["should-clear", group]:
+                return 0, str(self.clears(group)).lower()
+            case ["resolve"]:
+                lines = []
+                for line in message.split("\n")[1:]:
+                    instance, _, wm_class = line.partition(" ")
+                    group = self.location(instance, wm_class)
+                    lines.append(f"{group or '-'} {str(bool(group) and self.clears(group)).lower()}")
+                return 0, "\n".join(lines)
+            case _:
+                return 1, "unknown request"
+
+    async def delay(self, reader):
+        """sleeps for the configured latency, returns False if this request should hang"""
+        if random.random() < self.hang_rate:
+            # hang until the client gives up and hangs up.
+            await reader.read()
+            return False
+
+        wait = self.latency + random.uniform(0, self.jitter)
+        if wait:
+            await asyncio.sleep(wait)
+        return True
+
+    def reply(self, message):
+        ec, payload = self.answer(message)
+        if random.random() < self.error_rate:
+            ec = 1
+        return bytes([ec]) + b" " + payload.encode("utf-8")
+
+    async def handle(self, reader, writer):
+        try:
+            if self.oneshot:
+                message = (await reader.read()).decode("utf-8")
+                self.requests += 1
+                if await self.delay(reader):
+                    writer.write(self.reply(message))
+                    await writer.drain()
+                return
+
+            while True:
+                (length,) = HEADER.unpack(await reader.readexactly(HEADER.size))
+                message = (await reader.readexactly(length)).decode("utf-8")
+                self.requests += 1
+
+                if message == "subscribe":
+                    self.subscribers.add(writer)
+                    continue
+                if message == "rules":
+                    await self.send_rules(writer)
+                    continue
+                if not await self.delay(reader):
+                    return
+
+                body = self.reply(message)
+                writer.write(HEADER.pack(len(body)) + body)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.subscribers.discard(writer)
+            writer.close()
+
+    async def send_rules(self, writer):
+        def frame(body):
+            writer.write(HEADER.pack(len(body)) + body)
+
+        if not self.serve_rules:
+            frame(b"\x01 rules not supported")
+            return
+
+        frame(b"\x00 ")
+        data = "\n".join(self.rule_lines()).encode("utf-8")
+        for i in range(0, len(data), 4096):
+            frame(data[i:i + 4096])
+        frame(b"")
+        await writer.drain()
+
+    def push(self, message):
+        body = message.encode("utf-8")
+        for writer in list(self.subscribers):
+            writer.write(HEADER.pack(len(body)) + body)
+
+    async def pusher(self):
+        """simulates layout switches"""
+        while True:
+            await asyncio.sleep(self.push_every)
+            self.push("rules-reset")
+            self.push("invalidate")
+
+    async def serve(self, path):
+        if os.path.exists(path):
+            os.unlink(path)
+
+        server = await asyncio.start_unix_server(self.handle, path)
+        if self.push_every:
+            asyncio.get_running_loop().create_task(self.pusher())
+
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="fake auto-desk server")
+    parser.add_argument("--path", default="/tmp/fake-auto-desk")
+    parser.add_argument("--rules", type=int, default=100, help="number of App<n> placement rules")
+    parser.add_argument("--latency", type=float, default=0.0, help="ms added to every reply")
+    parser.add_argument("--jitter", type=float, default=0.0, help="up to this many extra ms per reply")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of replies with an error code")
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="fraction of requests never answered")
+    parser.add_argument("--oneshot", action="store_true", help="speak the old unframed protocol")
+    parser.add_argument("--no-rules", action="store_true", help="refuse 'rules' snapshot requests")
+    parser.add_argument("--push-every", type=float, default=None,
+                        help="push a rules-reset + invalidate to subscribers every N seconds")
+    args = parser.parse_args()
+
+    server = FakeAutoDesk(
+        rules=args.rules,
+        latency=args.latency / 1000,
+        jitter=args.jitter / 1000,
+        error_rate=args.error_rate,
+        hang_rate=args.hang_rate,
+        oneshot=args.oneshot,
+        serve_rules=not args.no_rules,
+        push_every=args.push_every,
+    )
+
+    try:
+        asyncio.run(server.serve(args.path))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+fakes.py
+
+stand-ins for qtile's Qtile, Group and Window, just enough of them for api.py's
+hooks to run outside of qtile. groups relayout (at RELAYOUT_COST seconds per
+window) on every add/remove while visible, like the real ones.
+"""
+
+import time
+
+
+RELAYOUT_COST = 20e-6  # per window in the group, roughly a configure request each
+
+
+class FakeQtile:
+    def __init__(self, groups=()):
+        self.groups_map = {}
+        for name in groups:
+            FakeGroup(self, name, visible=name != "hidden")
+
+
+class FakeGroup:
+    def __init__(self, qtile, name, visible=True):
+        self.qtile = qtile
+        self.name = name
+        self.windows = []
+        self.screen = object() if visible else None
+        self.relayouts = 0
+        qtile.groups_map[name] = self
+
+    def layout_all(self, warp=False):
+        self.relayouts += 1
+        end = time.perf_counter() + RELAYOUT_COST * len(self.windows)
+        while time.perf_counter() < end:
+            pass
+
+    def add(self, win):
+        self.windows.append(win)
+        win.group = self
+        if self.screen:
+            self.layout_all()
+
+    def remove(self, win):
+        self.windows.remove(win)
+        win.group = None
+        if self.screen:
+            self.layout_all()
+
+
+class FakeWindow:
+    def __init__(self, wid, pid, wm_class=("fake", "Fake")):
+        self.wid = wid
+        self.pid = pid
+        self.wm_class = list(wm_class)
+        self.name = wm_class[1]
+        self.group = None
+
+    def get_pid(self):
+        return self.pid
+
+    def get_wm_class(self):
+        return self.wm_class
+
+    def togroup(self, name):
+        group = self.group.qtile.groups_map[name]
+        if group is not self.group:
+            self.group.remove(self)
+            group.add(self)
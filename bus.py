@@ -0,0 +1,65 @@
+######################################
+# Shared asyncio D-Bus connections   #
+######################################
+
+# one dbus_next connection per bus (session / system) for the whole config,
+# made on first use on qtile's event loop and remade if it drops. everything
+# that talks D-Bus (notify.py, ...) gets its connection from get_bus().
+
+
+from libqtile.log_utils import logger
+from libqtile import hook
+from dbus_next import BusType
+from dbus_next.aio import MessageBus
+import asyncio
+
+
+# a config reload runs this module again (same globals) without the shutdown
+# hook, so the connections made before it are closed here instead of leaked.
+if "disconnect_buses" in globals():
+    disconnect_buses()
+
+
+BUSES = {}  # BusType -> connected MessageBus
+_LOCKS = {}  # BusType -> asyncio.Lock, so concurrent first users share one connect
+TASKS = globals().get("TASKS", set())  # run_soon() tasks still running, kept across reloads
+
+
+async def get_bus(bus_type=BusType.SESSION):
+    """the shared connection to the session (default) or system bus"""
+    bus = BUSES.get(bus_type)
+    if bus is not None and bus.connected:
+        return bus
+
+    lock = _LOCKS.setdefault(bus_type, asyncio.Lock())
+    async with lock:
+        bus = BUSES.get(bus_type)
+        if bus is None or not bus.connected:
+            bus = await MessageBus(bus_type=bus_type).connect()
+            BUSES[bus_type] = bus
+    return bus
+
+
+def run_soon(coro):
+    """
+    schedules coro on the running loop, for sync code (lazy functions, sync hooks)
+    that can't await it. a reference is kept until it's done and whatever it
+    raises is logged instead of being lost with the task.
+    """
+    task = asyncio.get_running_loop().create_task(coro)
+    TASKS.add(task)
+    task.add_done_callback(_task_done)
+    return task
+
+
+def _task_done(task):
+    TASKS.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"background task failed: {task.exception()!r}")
+
+
+@hook.subscribe.shutdown
+def disconnect_buses():
+    for bus in BUSES.values():
+        bus.disconnect()
+    BUSES.clear()
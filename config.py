@@ -32,6 +32,12 @@ from libqtile.lazy import lazy
 from libqtile.core.manager import Qtile
 # from gi.repository import Notify
 from logger import Logger as FuncLog
+from notify import Notifier
+from bus import run_soon
+from battery import BATTERY, BatteryWidget
+from audio import AUDIO, VolumeWidget, media_key
+from backlight import BACKLIGHT
+from spawner import spawn
 from libqtile.log_utils import logger
 # import api  # not used but a necessary import
 # from frankentile.auto_desk import *  # auto_desk_init
@@ -51,8 +57,17 @@ LOGGER = FuncLog(
     debug=DEBUG,
     logging=True,
     io_stream=None,
-    log_file=HOME + ".local/share/qtile/qtile_user_funciton.log"
+    log_file=HOME + ".local/share/qtile/qtile_user_funciton.log",
+    # always-on latency histograms for the @LOGGER.log functions, dumped every minute.
+    profile=True,
+    stats_file=HOME + ".local/share/qtile/qtile_function_stats.txt",
+    # one logsink.py (started by autostart.sh) writes the log for qtile and the helpers,
+    # and sets how it's rotated.
+    sink="/tmp/qtile/log.sock",
+    # the last 500 calls stay in memory even with DEBUG off, see dump_recent_log.
+    recent=500,
 )
+RECENT_LOG = "/tmp/qtile/recent_calls.log"
 BOT_HANDLE = None
 
 
@@ -75,17 +90,15 @@ def motd():
         return "MOTD error, missing file"
 
 
-def _get_bat_level():
+async def _get_bat_level():
     """
     returns a tuple containing the battery percent and powersource
     i.e (charging or discharging)
     """
-    import psutil
-
-    battery = psutil.sensors_battery()
-    # battery.power_plugged will be true when the laptop is unplugged ??? WHY!
-    charging = battery.power_plugged
-    seconds = battery.secsleft
+    battery = await BATTERY.current()
+    charging = battery.charging
+    # smoothed estimate, see battery.py. 0 until UPower has one.
+    seconds = battery.time_left or 0
     time_left = convert_time(seconds)
 
     return (battery.percent, charging, time_left, seconds)
@@ -102,30 +115,24 @@ def convert_time(seconds):
     return "%d:%02d" % (hours, minutes)
 
 
-def bat_notif(title="Battery:  {bat}% ({state})", message_lines=["~{time_left} op time left...", "estimated total battery life. ~{battery_capacity}..."]):
-    import dbus
+# one popup for all the battery notifications, each one replaces the last.
+BAT_NOTIFIER = Notifier("bat-notif")
 
-    bus_name = "org.freedesktop.Notifications"
-    object_path = "/org/freedesktop/Notifications"
-    interface = bus_name
 
-    notify = dbus.Interface(dbus.SessionBus().get_object(
-        bus_name, object_path), interface)
-    perc, charging, time_left, seconds = _get_bat_level()
-    bat_cap = convert_time(seconds/(perc/100))
+async def bat_notif(title="Battery:  {bat}% ({state})", message_lines=["~{time_left} op time left...", "estimated total battery life. ~{battery_capacity}..."]):
+    perc, charging, time_left, seconds = await _get_bat_level()
+    bat_cap = convert_time(seconds/(perc/100)) if perc else "?"
     state = "Charging" if charging else "Discharging"
     time_left = time_left if not charging else "inf"
 
     message = "\n".join([line.format(bat=round(perc, 1), state=state, time_left=time_left, battery_capacity=bat_cap)
                         for line in message_lines])
 
-    notify.Notify(
-        "bat-notif", 0, "",  # first string is the app name
+    await BAT_NOTIFIER.notify(
         title.format(bat=round(perc, 1), state=state, time_left=time_left),
         message,
-        [],
-        {"urgency": 1},
-        3500
+        key="battery",
+        timeout=3500,
     )
 
 
@@ -134,18 +141,31 @@ def lazy_bat_notif(qtile):
     """lazy function wrapper for bat_notif"""
     if qtile.core.name == "x11":
         # bat_notif("Battery:  {bat}% ({state})", ["~{time_left} op time left"])
-        bat_notif(
+        run_soon(bat_notif(
             "Battery:  {bat}% ({state})", [
                 "~{time_left} op time left",
                 "~{battery_capacity} estimated total battery life."
             ]
-        )
+        ))
+
+
+def dump_recent_log(func=None, level=None):
+    """writes the recently logged calls (optionally only func's / level's) to RECENT_LOG"""
+    os.makedirs(os.path.dirname(RECENT_LOG), exist_ok=True)
+    LOGGER.dump_recent(RECENT_LOG, func=func, level=level)
+    return RECENT_LOG
+
+
+@lazy.function
+def lazy_recent_log(qtile, func=None, level=None):
+    """opens the recently logged calls in a terminal"""
+    qtile.spawn(f"{terminal} -e less +G {dump_recent_log(func, level)}")
 
 
 @lazy.function
 def lazy_sh(qtile, app):
     """lazy spawn an app in a subprocess."""
-    os.system(app)
+    spawn(app)
 
 
 # @lazy.function
@@ -256,6 +276,7 @@ keys = [
         "rofi -modi \"Power\":\"rofi-power-menu\" -show \"Power\""), desc="Power/Logout menu"),
     Key([mod], "s", lazy_bat_notif, desc="Check battery level"),
     Key([mod], "v", lazy.spawn("pavucontrol"), desc="audio volume mixer"),
+    Key([mod, "shift"], "l", lazy_recent_log, desc="show recently logged calls"),
     Key([alt_key], "c", lazy.spawn("xdotool key Caps_Lock"),
         desc="TOGLE CAPSLOCK (as you can see this is important)"),
     Key([mod, "shift"], "p", lazy.spawn(terminal + \
@@ -269,25 +290,17 @@ keys = [
     Key([mod], "n", lazy.group['scratchpad'].dropdown_toggle('notes')),
 
     # Media/fn-keys stuff
-    Key([], "XF86AudioRaiseVolume", lazy.function(lambda qtile: os.system(
-        'bash ~/.config/system_scripts/volume up')), desc="Raise the volume"),
-    Key([], "XF86AudioLowerVolume", lazy.function(lambda qtile: os.system(
-        'bash ~/.config/system_scripts/volume down')), desc="Lower the volume"),
-    Key([], "XF86AudioMute", lazy.function(lambda qtile: os.system(
-        'bash ~/.config/system_scripts/volume mute')), desc="Mute the volume"),
+    Key([], "XF86AudioRaiseVolume", lazy.function(lambda qtile: AUDIO.volume_up()), desc="Raise the volume"),
+    Key([], "XF86AudioLowerVolume", lazy.function(lambda qtile: AUDIO.volume_down()), desc="Lower the volume"),
+    Key([], "XF86AudioMute", lazy.function(lambda qtile: AUDIO.toggle_mute()), desc="Mute the volume"),
     Key([], "XF86AudioMedia", lazy.spawn("lollypop"), desc="launch media player"),
     # lazy.function(lambda qtile: os.system(
     # 'bash ~/.config/system_scripts/volume pause')), desc="Pasue media"),
-    Key([], "XF86AudioPlay", lazy.function(lambda qtile: os.system(
-        'bash ~/.config/system_scripts/volume pause')), desc="Play media"),
-    Key([], "XF86AudioPrev", lazy.function(lambda qtile: os.system(
-        'bash ~/.config/system_scripts/volume prev')), desc="Previous track"),
-    Key([], "XF86AudioNext", lazy.function(lambda qtile: os.system(
-        'bash ~/.config/system_scripts/volume next')), desc="Next track"),
-    Key([], "XF86MonBrightnessUp", lazy.function(lambda qtile: os.system(
-        'bash ~/.config/system_scripts/brightness up')), desc="increase screen brightness"),
-    Key([], "XF86MonBrightnessDown", lazy.function(lambda qtile: os.system(
-        'bash ~/.config/system_scripts/brightness down ')), desc="Lower screen brightness"),
+    Key([], "XF86AudioPlay", lazy.function(media_key("play_pause")), desc="Play media"),
+    Key([], "XF86AudioPrev", lazy.function(media_key("previous")), desc="Previous track"),
+    Key([], "XF86AudioNext", lazy.function(media_key("next")), desc="Next track"),
+    Key([], "XF86MonBrightnessUp", lazy.function(lambda qtile: BACKLIGHT.up()), desc="increase screen brightness"),
+    Key([], "XF86MonBrightnessDown", lazy.function(lambda qtile: BACKLIGHT.down()), desc="Lower screen brightness"),
     # Key([], "", lazy.function(lambda qtile: os.system('bash ~/.config/system_scripts/volume ')), desc=""),
 ]
 
@@ -433,10 +446,10 @@ main_bar = bar.Bar(
         widget.Spacer(length=15),
         # widget.Systray(),
         widget.Spacer(length=15),
-        widget.Volume(fmt="Vol: {}", foreground="#fab387"),
+        VolumeWidget(fmt="Vol: {}", foreground="#fab387"),
         widget.Spacer(length=15),
         extras.UPowerWidget(),
-        widget.Battery(
+        BatteryWidget(
             # format='{char} {percent:2.0%} {watt:.2f} W', foreground="#fab387"),
             format='{percent:2.0%}', foreground="#fab387"),
         # widget.QuickExit(),
@@ -518,10 +531,8 @@ wmname = "LG3D"
 @hook.subscribe.startup_once
 def autostart():
     """runs the autostart shell script"""
-    import subprocess
-
     home = os.path.expanduser('~')
-    subprocess.Popen([home + '/.config/qtile/autostart.sh'])
+    spawn([home + '/.config/qtile/autostart.sh'])
 
 
 # @hook.subscribe.client_new
@@ -560,8 +571,8 @@ def autostart():
 def greet_user():
     """notifies the user of the batery level when they login"""
     if qtile.core.name == "x11":
-        bat_notif(f"Greetings  {os.getlogin().title()}",
-                  ["Battery:  {bat}% & {state}"])
+        run_soon(bat_notif(f"Greetings  {os.getlogin().title()}",
+                           ["Battery:  {bat}% & {state}"]))
 
 
 @hook.subscribe.shutdown
@@ -572,11 +583,19 @@ def autostop():
     # API.stop_api()
     home = os.path.expanduser('~')
     subprocess.Popen([home + '/.config/qtile/autostop.sh'])
+    LOGGER.close()
+
+
+# qtile cmd-obj -o cmd -f fire_user_hook -a dump_recent_log [func] [level]
+@hook.subscribe.user("dump_recent_log")
+def recent_log_hook(func=None, level=None):
+    """dumps the recently logged calls to RECENT_LOG, for when there's no keyboard handy"""
+    dump_recent_log(func, level)
 
 
 # relload config on screen change. uncomment "@hook.subscribe.screen_change
 @hook.subscribe.screen_change
-# @LOGGER.log
+@LOGGER.log
 def reload_config(randr_event):
     """
     reloads the configs when new monitors are activated.
@@ -597,13 +616,12 @@ def reload_config(randr_event):
 
 
 @hook.subscribe.startup_once
+@LOGGER.log
 async def autorandr():
     """autorandrs on start"""
-    import subprocess 
-
     # subprocess.Popen(['autorandr -c'])
     if qtile.core.name == "x11":
-        subprocess.Popen(['autorandr', '-c'])
+        spawn(['autorandr', '-c'])
         # os.system("autorandr -c")
     logger.warning("autorandr autorandred")
 
@@ -690,7 +708,7 @@ def get_n_mon():
     return len(get_monitors())
 
 
-# @LOGGER.log
+@LOGGER.log
 def add_screens_x():
     """called to add 1 default screen to the screens list for every attached monitor"""
     # if os.getenv('XDG_SESSION_TYPE').lower() == "wayland":
@@ -0,0 +1,311 @@
+########################################
+# Hidden group window lifecycle hooks  #
+########################################
+
+# windows pushed into the "hidden" group by api.clear_group stay alive forever.
+# this tracks how long each one has been hidden and, per POLICIES, SIGSTOPs its
+# process (resumed as soon as the window is accessed again) or closes it.
+
+
+from libqtile.log_utils import logger
+from libqtile.config import Match
+from libqtile import hook, qtile
+import asyncio
+import os
+import re
+import signal
+import socket
+import time
+
+
+
+HIDDEN = "hidden"
+CHECK_INTERVAL = 30  # seconds between policy checks
+CLK_TCK = os.sysconf("SC_CLK_TCK")
+
+
+class Policy:
+    """
+    what to do with hidden windows matching `match` (None matches everything).
+    suspend_after / close_after are in seconds spent in the hidden group, None means never.
+    """
+
+    def __init__(self, match=None, suspend_after=None, close_after=None):
+        self.match = match
+        self.suspend_after = suspend_after
+        self.close_after = close_after
+
+    def matches(self, window):
+        return self.match is None or self.match.compare(window)
+
+
+# first matching policy wins.
+POLICIES = [
+    # browsers & electron apps, the usual idle cpu/ram hogs.
+    Policy(Match(wm_class=re.compile(r"^(firefox|Firefox|discord|Slack|Code|code-oss)$")), suspend_after=10 * 60),
+    # music players etc. keep working while hidden.
+    Policy(Match(wm_class=re.compile(r"^(Spotify|spotify|lollypop|Lollypop)$"))),
+    Policy(),
+]
+
+
+class Hidden:
+    """one window sitting in the hidden group"""
+
+    def __init__(self, window, policy):
+        self.window = window
+        self.policy = policy
+        self.since = time.monotonic()
+        self.pid = None
+        self.suspended_at = None
+        self.cpu_at_hide = None
+
+
+class HiddenManager:
+    def __init__(self, policies=POLICIES):
+        self.policies = policies
+        self.windows = {}  # wid -> Hidden
+        self.suspended = {}  # pid -> (suspended at, cpu seconds/second before suspending)
+        self.timer = None
+        # counters for stats()
+        self.suspends = 0
+        self.resumes = 0
+        self.closed = 0
+        self.rss_reclaimed_kb = 0
+        self.cpu_seconds_saved = 0.0
+
+    def start(self):
+        if self.timer is None:
+            self.timer = qtile.call_later(CHECK_INTERVAL, self._tick)
+
+    def stop(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        # never leave a process stopped behind us.
+        for pid in list(self.suspended):
+            self._resume(pid)
+
+    def adopt(self, previous):
+        """
+        takes over from the manager of the config before a reload. it's stopped,
+        so nothing it suspended stays that way, and its windows are tracked here
+        from when they were hidden.
+        """
+        previous.stop()
+        for entry in previous.windows.values():
+            self.hidden(entry.window)
+            if entry.window.wid in self.windows:
+                self.windows[entry.window.wid].since = entry.since
+
+    def hidden(self, window):
+        """called when a window is moved into the hidden group"""
+        policy = next((p for p in self.policies if p.matches(window)), None)
+        if policy is None or (policy.suspend_after is None and policy.close_after is None):
+            return
+
+        entry = Hidden(window, policy)
+        if policy.suspend_after is not None:
+            entry.pid = window.get_pid()
+            entry.cpu_at_hide = _cpu_seconds(entry.pid)
+        self.windows[window.wid] = entry
+
+    def accessed(self, window):
+        """called when a window leaves the hidden group (or is killed)"""
+        entry = self.windows.pop(window.wid, None)
+        if entry is not None and entry.pid in self.suspended:
+            self._resume(entry.pid)
+
+    def accessed_all(self):
+        """the hidden group itself is being looked at, wake everything up"""
+        now = time.monotonic()
+        for pid in list(self.suspended):
+            self._resume(pid)
+        for entry in self.windows.values():
+            entry.since = now
+
+    def _tick(self):
+        self.timer = qtile.call_later(CHECK_INTERVAL, self._tick)
+        now = time.monotonic()
+
+        for wid, entry in list(self.windows.items()):
+            elapsed = now - entry.since
+            policy = entry.policy
+            if policy.close_after is not None and elapsed >= policy.close_after:
+                self._close(entry)
+            elif (policy.suspend_after is not None and elapsed >= policy.suspend_after
+                    and entry.pid not in self.suspended):
+                self._suspend(entry, now)
+
+    def _suspend(self, entry, now):
+        pid = entry.pid
+        if not pid or pid == os.getpid() or self._visible_elsewhere(pid):
+            return
+        if not _local_pid(entry.window, pid):
+            # never SIGSTOP a pid we can't tie to the window, see _local_pid.
+            logger.info(f"not suspending {entry.window.name}, pid {pid} isn't its local process")
+            entry.pid = None
+            return
+
+        cpu = _cpu_seconds(pid)
+        rate = 0.0
+        if cpu is not None and entry.cpu_at_hide is not None:
+            rate = (cpu - entry.cpu_at_hide) / max(now - entry.since, 1)
+
+        try:
+            os.kill(pid, signal.SIGSTOP)
+        except ProcessLookupError:
+            return
+
+        logger.info(f"suspended hidden pid {pid} ({entry.window.name})")
+        self.suspended[pid] = (now, rate)
+        self.suspends += 1
+
+    def _resume(self, pid):
+        suspended_at, rate = self.suspended.pop(pid)
+        try:
+            os.kill(pid, signal.SIGCONT)
+        except ProcessLookupError:
+            pass
+
+        self.resumes += 1
+        self.cpu_seconds_saved += rate * (time.monotonic() - suspended_at)
+        for entry in self.windows.values():
+            if entry.pid == pid:
+                entry.cpu_at_hide = _cpu_seconds(pid)
+                entry.since = time.monotonic()
+
+    def _close(self, entry):
+        window = entry.window
+        pid = entry.pid or window.get_pid()
+        self.windows.pop(window.wid, None)
+        if pid in self.suspended:
+            # it has to be running to handle WM_DELETE_WINDOW.
+            self._resume(pid)
+
+        local = pid and _local_pid(window, pid)
+        rss = _rss_kb(pid) if local and not self._visible_elsewhere(pid) else None
+        logger.info(f"closing window hidden for too long ({window.name})")
+        window.kill()
+        self.closed += 1
+        if rss:
+            self.rss_reclaimed_kb += rss
+
+    def _visible_elsewhere(self, pid):
+        """True if the process owns windows outside the hidden group"""
+        for w in qtile.windows_map.values():
+            group = getattr(w, "group", None)
+            if group is not None and group.name != HIDDEN and w.get_pid() == pid:
+                return True
+        return False
+
+    def stats(self):
+        return {
+            "tracked": len(self.windows),
+            "suspended": len(self.suspended),
+            "suspends": self.suspends,
+            "resumes": self.resumes,
+            "closed": self.closed,
+            "rss_suspended_kb": sum(_rss_kb(pid) or 0 for pid in self.suspended),
+            "rss_reclaimed_kb": self.rss_reclaimed_kb,
+            "cpu_seconds_saved": round(self.cpu_seconds_saved, 2),
+        }
+
+
+def _local_pid(window, pid):
+    """
+    True if pid looks like the process that really owns window. _NET_WM_PID is
+    set by the client, so ssh -X windows (another machine's pid) and flatpak
+    apps (a pid from inside their sandbox) can point it at an unrelated process
+    of ours. requires the window to be from this host, the process to be ours,
+    and its command line to mention the window's WM_CLASS.
+    """
+    xwin = getattr(window, "window", None)
+    if hasattr(xwin, "get_property"):
+        try:
+            machine = xwin.get_property("WM_CLIENT_MACHINE", "STRING", unpack=str)
+        except Exception:
+            machine = None
+        if not machine or machine.split(".")[0].lower() != socket.gethostname().split(".")[0].lower():
+            return False
+
+    try:
+        if os.stat(f"/proc/{pid}").st_uid != os.getuid():
+            return False
+        with open(f"/proc/{pid}/comm") as f:
+            comm = f.read().strip().lower()
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            cmdline = f.read().replace(b"\0", b" ").decode(errors="replace").lower()
+    except OSError:
+        return False
+
+    names = [name.lower() for name in (window.get_wm_class() or []) if name]
+    return any(name in cmdline or name in comm or (comm and comm in name) for name in names)
+
+
+def _rss_kb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def _cpu_seconds(pid):
+    """user + system cpu time of a process"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # the command name can hold spaces and parens, so split after the last ')'
+            fields = f.read().rsplit(")", 1)[1].split()
+    except (OSError, IndexError):
+        return None
+    return (int(fields[11]) + int(fields[12])) / CLK_TCK
+
+
+# qtile re-runs this module on a config reload, firing neither startup_complete
+# nor shutdown. the old MANAGER would keep its timer (and SIGSTOPping) with no
+# hooks left to resume anything, so the new one takes over from it below.
+_previous = globals().get("MANAGER")
+MANAGER = HiddenManager()
+
+
+def hidden_stats():
+    """returns what the hidden group manager has suspended/closed and what it saved"""
+    return MANAGER.stats()
+
+
+@hook.subscribe.shutdown
+def stop_hidden_manager():
+    MANAGER.stop()
+
+
+@hook.subscribe.group_window_add
+def track_hidden(group, window):
+    if group.name == HIDDEN:
+        MANAGER.hidden(window)
+    else:
+        MANAGER.accessed(window)
+
+
+@hook.subscribe.client_killed
+def forget_hidden(window):
+    MANAGER.accessed(window)
+
+
+@hook.subscribe.setgroup
+def hidden_group_shown():
+    if qtile.current_group.name == HIDDEN:
+        MANAGER.accessed_all()
+
+
+if _previous is not None:
+    MANAGER.adopt(_previous)
+try:
+    asyncio.get_running_loop()
+except RuntimeError:
+    pass  # not running in qtile
+else:
+    MANAGER.start()
@@ -14,20 +14,51 @@ from types import FunctionType, BuiltinFunctionType, LambdaType
 # method types
 from types import MethodType, BuiltinMethodType, BuiltinMethodType, MethodDescriptorType
 import os
+import sys
 from datetime import datetime as dt
+import atexit
+import functools
+import inspect
+import json
+import errno
+import gzip
+import queue
+import random
+import re
+import reprlib
+import shutil
+import socket
+import threading
+import time
 
 
 class LogData:
-    def __init__(self):
-        self._level = None  # info, log, debug, error, panic
-        self.obj_name: str = None
-        self.obj_args: list = None
-        self.obj_kwargs: dict = None
-        self.obj_type: str = None  # function, method, class
-        self.return_val = None
+    """
+    one call of a logged function. created per call, and only when it's going to
+    be written, the line itself is only formatted (str()) by the writer thread.
+    Logger fills it with Snapshot.capture()d args/return values, so a record
+    waiting in the queue doesn't keep the real objects alive.
+    """
+
+    __slots__ = ("_level", "obj_name", "obj_args", "obj_kwargs", "obj_type", "return_val", "return_type",
+                 "time", "wall", "cpu")
+
+    def __init__(self, level=None, name=None, obj_type=None, args=(), kwargs=None, return_val=None, when=None,
+                 wall=None, cpu=None, return_type=None):
+        self._level = level  # info, log, debug, error, panic
+        self.obj_name: str = name
+        self.obj_args: tuple = args
+        self.obj_kwargs: dict = kwargs if kwargs is not None else {}
+        self.obj_type: str = obj_type  # function, method, class
+        self.return_val = return_val
+        # the type of the real return value, return_val may only be a snapshot of it.
+        self.return_type: type = type(return_val) if return_type is None else return_type
+        self.time: float = time.time() if when is None else when
+        self.wall: float = wall  # seconds from call to return, awaits included
+        self.cpu: float = cpu  # seconds of that spent running on this thread
 
     def __repr__(self):
-        return self
+        return str(self)
 
     def __str__(self):
         lvl = self._make_level()
@@ -39,20 +70,42 @@ class LogData:
             interact_verb = "instantiated"
 
         # make comma separated string list of all the arguemnts sent to the obj/func
-        all_args = [f"\"{arg}\"" if type(arg) == str else str(arg) for arg in self.obj_args]
-        [all_args.append(f"{name}={self.kwargs.get(val)}") for name in self.obj_kwargs.keys()]
+        all_args = [f"\"{arg}\"" if type(arg) == str else str(arg) for arg in self.obj_args]  # _Repr isn't quoted
+        all_args.extend(f"{name}={val}" for name, val in self.obj_kwargs.items())
         args = ", ".join(all_args)
         
         # make data about the data returned by the obj
-        return_type = f"{type(self.return_val)}"
+        return_type = f"{self.return_type}"
         return_value = f"<{self.return_val}>"        
         
-        msg = f"{dt.now().isoformat()} | {lvl} {self.obj_type} <{self.obj_name}> {interact_verb}: {self.obj_name}({args}) => {return_type} {return_value}" 
+        msg = f"{dt.fromtimestamp(self.time).isoformat()} | {lvl} {self.obj_type} <{self.obj_name}> {interact_verb}: {self.obj_name}({args}) => {return_type} {return_value}" 
+
+        if self.wall is not None:
+            msg += f" [{self.wall * 1000:.3f}ms, {self.cpu * 1000:.3f}ms cpu]"
 
         return msg
 
+    def to_json(self):
+        """the record as one JSON Lines line (no trailing newline)"""
+        data = {
+            "ts": self.time,
+            "level": self._level,
+            "type": self.obj_type,
+            "func": self.obj_name,
+            "args": [_json_safe(arg) for arg in self.obj_args],
+            "kwargs": {name: _json_safe(val) for name, val in self.obj_kwargs.items()},
+            "ret": _json_safe(self.return_val),
+            "ret_type": self.return_type.__name__,
+        }
+        if self.wall is not None:
+            data["wall_ms"] = round(self.wall * 1000, 3)
+            data["cpu_ms"] = round(self.cpu * 1000, 3)
+        # compact separators, logquery.py's pre-filter relies on them.
+        return json.dumps(data, separators=(",", ":"))
+
     def set_return_val(self, value):
-        self.return_val = "value"
+        self.return_val = value
+        self.return_type = type(value)
     
     def set_level(self, level):
         match level.lower():
@@ -97,13 +150,629 @@ class LogData:
         return f"[{self._level.upper()}]"
 
 
+def _json_safe(value):
+    """value as is if JSON can hold it, its str() otherwise"""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+
+def _first_record_time(path):
+    """
+    the timestamp of the first record in the log file at path (text or jsonl),
+    now for an empty file. a first line without one (eg. written by something
+    else) falls back to the file's mtime.
+    """
+    try:
+        with open(path, "rb") as f:
+            line = f.readline(4096).decode("utf-8", errors="replace")
+            mtime = os.fstat(f.fileno()).st_mtime
+    except OSError:
+        return time.time()
+    if not line.strip():
+        return time.time()
+
+    if line.startswith("{"):
+        # to_json() always puts "ts" first.
+        match = re.match(r'\{"ts":\s*([0-9.]+)', line)
+        if match:
+            return min(float(match.group(1)), time.time())
+    else:
+        try:
+            return min(dt.fromisoformat(line.split(" | ", 1)[0]).timestamp(), time.time())
+        except ValueError:
+            pass
+    return mtime
+
+
+class _Repr(str):
+    """the repr of a captured (non str) value, so it isn't quoted like a str arg would be"""
+
+    __slots__ = ()
+
+
+class Snapshot(reprlib.Repr):
+    """
+    bounded, truncated stand-ins for logged args/return values. numbers, bools and
+    None are kept as is, strings are cut to max_repr chars and everything else
+    becomes a reprlib repr at most max_depth containers deep, max_items items per
+    container and max_repr chars long.
+    """
+
+    def __init__(self, max_repr=200, max_depth=2, max_items=8):
+        super().__init__()
+        self.max_repr = max_repr
+        self.maxlevel = max_depth
+        self.maxtuple = self.maxlist = self.maxarray = self.maxdict = max_items
+        self.maxset = self.maxfrozenset = self.maxdeque = max_items
+        self.maxstring = self.maxother = self.maxlong = max_repr
+
+    def capture(self, value):
+        if value is None or isinstance(value, (bool, int, float)):
+            return value
+        if isinstance(value, str):
+            if len(value) > self.max_repr:
+                return value[:self.max_repr - 3] + "..."
+            return value
+
+        try:
+            text = self.repr(value)
+        except Exception as e:
+            text = f"<unrepresentable {type(value).__name__}: {e!r}>"
+        if len(text) > self.max_repr:
+            text = text[:self.max_repr - 3] + "..."
+        return _Repr(text)
+
+    def capture_args(self, args, kwargs):
+        return (tuple(self.capture(arg) for arg in args),
+                {name: self.capture(val) for name, val in kwargs.items()})
+
+
+class Limiter:
+    """
+    decides which calls of one function get a record written.
+
+    sample is an int N (every Nth call) or a float p (each call with probability p).
+    rate/burst is a token bucket, `rate` records per second on average and at most
+    `burst` (defaults to rate, at least 1) back to back. calls it turns away are
+    counted in self.suppressed.
+    """
+
+    __slots__ = ("sample", "rate", "burst", "tokens", "last", "calls", "suppressed")
+
+    def __init__(self, sample=None, rate=None, burst=None):
+        if isinstance(sample, float) and not 0 <= sample <= 1:
+            raise ValueError(f"sample probability must be between 0 and 1, not {sample}")
+        if isinstance(sample, int) and sample < 1:
+            raise ValueError(f"sample must be at least 1, not {sample}")
+        self.sample = sample
+        self.rate = rate
+        self.burst = max(1.0, float(burst if burst is not None else rate or 1))
+        self.tokens = self.burst
+        self.last = time.monotonic()
+        self.calls = 0
+        self.suppressed = 0
+
+    def allow(self):
+        self.calls += 1
+        if isinstance(self.sample, float):
+            if random.random() >= self.sample:
+                return False
+        elif self.sample is not None and (self.calls - 1) % self.sample:
+            return False
+
+        if self.rate is None:
+            return True
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        if self.tokens < 1:
+            self.suppressed += 1
+            return False
+        self.tokens -= 1
+        return True
+
+    def take_suppressed(self):
+        n, self.suppressed = self.suppressed, 0
+        return n
+
+
+class Suppressed:
+    """the "suppressed N similar records" line written in place of rate limited records"""
+
+    __slots__ = ("obj_name", "count", "time")
+
+    def __init__(self, name, count):
+        self.obj_name = name
+        self.count = count
+        self.time = time.time()
+
+    def __str__(self):
+        return f"{dt.fromtimestamp(self.time).isoformat()} | [INFO] <{self.obj_name}> suppressed {self.count} similar records"
+
+    def to_json(self):
+        return json.dumps({"ts": self.time, "level": "info", "func": self.obj_name, "suppressed": self.count},
+                          separators=(",", ":"))
+
+
+class Ring:
+    """the last `size` items added, in a list allocated up front. the oldest is overwritten first."""
+
+    __slots__ = ("slots", "next")
+
+    def __init__(self, size):
+        self.slots = [None] * size
+        self.next = 0
+
+    def add(self, item):
+        self.slots[self.next] = item
+        self.next = (self.next + 1) % len(self.slots)
+
+    def __iter__(self):
+        """oldest first"""
+        for item in self.slots[self.next:] + self.slots[:self.next]:
+            if item is not None:
+                yield item
+
+
+class Histogram:
+    """
+    fixed memory latency histogram (HDR style log-linear buckets).
+
+    values are in nanoseconds. below SUB_BUCKETS every value has its own bucket,
+    above that each power of two is split in SUB_BUCKETS / 2 linear buckets, so
+    any percentile is within ~1/16th of the real value no matter the range.
+    """
+
+    SUB_BITS = 5
+    SUB_BUCKETS = 1 << SUB_BITS
+    HALF = SUB_BUCKETS // 2
+    MAX_SHIFT = 36  # top bucket starts around 2^40ns, ~18 minutes
+    N_BUCKETS = SUB_BUCKETS + MAX_SHIFT * HALF
+
+    __slots__ = ("counts", "count", "errors", "total", "min", "max")
+
+    def __init__(self):
+        self.counts = [0] * self.N_BUCKETS
+        self.count = 0
+        self.errors = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def add(self, seconds, error=False):
+        ns = int(seconds * 1e9)
+        self.counts[self._index(ns)] += 1
+        self.count += 1
+        self.total += ns
+        if error:
+            self.errors += 1
+        if self.min is None or ns < self.min:
+            self.min = ns
+        if ns > self.max:
+            self.max = ns
+
+    def _index(self, ns):
+        if ns < self.SUB_BUCKETS:
+            return max(ns, 0)
+        shift = min(ns.bit_length() - self.SUB_BITS, self.MAX_SHIFT)
+        top = min(ns >> shift, self.SUB_BUCKETS - 1)
+        return self.SUB_BUCKETS + (shift - 1) * self.HALF + (top - self.HALF)
+
+    def _value(self, index):
+        """the middle of bucket `index`, in ns"""
+        if index < self.SUB_BUCKETS:
+            return index
+        shift = (index - self.SUB_BUCKETS) // self.HALF + 1
+        top = (index - self.SUB_BUCKETS) % self.HALF + self.HALF
+        return (top << shift) + (1 << shift) // 2
+
+    def percentile(self, p):
+        """returns the p (0 - 1) percentile, in ns"""
+        if not self.count:
+            return 0
+        target = max(1, round(p * self.count))
+        seen = 0
+        for index, n in enumerate(self.counts):
+            seen += n
+            if seen >= target:
+                return min(max(self._value(index), self.min), self.max)
+        return self.max
+
+    def summary(self):
+        """count, total/mean and percentiles in milliseconds"""
+        ms = 1e-6
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "total_ms": round(self.total * ms, 3),
+            "mean_ms": round(self.total / self.count * ms, 3) if self.count else 0,
+            "min_ms": round((self.min or 0) * ms, 3),
+            "p50_ms": round(self.percentile(.50) * ms, 3),
+            "p95_ms": round(self.percentile(.95) * ms, 3),
+            "p99_ms": round(self.percentile(.99) * ms, 3),
+            "max_ms": round(self.max * ms, 3),
+        }
+
+
+class Writer(threading.Thread):
+    """
+    background thread that does a Logger's file (and io_stream) writes.
+
+    records are queued by Logger.record and written in batches, whenever
+    batch_size records are waiting or flush_interval seconds after the first
+    one came in. the queue is bounded, when it's full records are dropped
+    (and counted in self.dropped) rather than blocking the caller.
+
+    with a sink (the path of a logsink.py collector's socket) each line is sent
+    to it as one datagram instead of being appended to log_file, which is only
+    written to while the sink can't be reached or for lines too big to send.
+    the collector rotates log_file, by the limits it was started with (see
+    logsink.py). while there's no collector this writer rotates it by those
+    same limits, read from the file the collector leaves next to log_file.
+    """
+
+    _STOP = object()
+    SINK_TIMEOUT = 0.5  # seconds to wait on a busy sink before falling back to the file
+    SINK_RETRY = 5  # seconds between attempts to reach a sink that wasn't there
+    MAX_DATAGRAM = 1 << 16  # biggest line (in bytes) sent to a sink, logsink.py reads no more than this
+    LIMITS_SUFFIX = ".limits"  # log_file + this holds the collector's rotation limits as JSON
+
+    def __init__(self, log_file=None, io_stream=None, max_queue=10000, batch_size=256, flush_interval=1.0,
+                 tick=None, tick_interval=None, max_bytes=None, max_age=None, backups=5, fmt="text",
+                 sink=None):
+        super().__init__(name="logger-writer", daemon=True)
+        self.logf = log_file
+        self.io = io_stream
+        self.fmt = fmt
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # the log file is rotated once it would grow past max_bytes or is older than
+        # max_age seconds (None turns either off). rotated segments are gzipped by
+        # a Compressor thread, which keeps the newest `backups` of them.
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        # with a sink these come from the collector instead, see _collector_limits().
+        rotate = log_file and (max_bytes or max_age) and sink is None
+        self.compressor = Compressor(log_file, backups) if rotate else None
+        self.started_at = None  # time of log_file's first record, what max_age counts from
+        # called from this thread every tick_interval seconds (and on close), eg. to dump stats.
+        self.tick = tick
+        self.tick_interval = tick_interval
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.file = None
+        self.sink = sink
+        self.sock = None
+        self.sink_retry_at = 0
+        self.written = 0
+        self.dropped = 0
+        self.sent = 0  # of self.written, how many went to the sink
+
+    def put(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+    def flush(self, timeout=None):
+        """blocks until everything queued so far has been written"""
+        if not self.is_alive():
+            return
+        done = threading.Event()
+        self.queue.put(done)
+        done.wait(timeout)
+
+    def close(self, timeout=None):
+        """writes out whatever is queued and stops the thread"""
+        if self.is_alive():
+            self.queue.put(self._STOP)
+            self.join(timeout)
+
+    def run(self):
+        batch = []
+        deadline = None
+        next_tick = None if self.tick is None else time.monotonic() + self.tick_interval
+
+        while True:
+            wake = min((d for d in (deadline, next_tick) if d is not None), default=None)
+            timeout = None if wake is None else max(0, wake - time.monotonic())
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if next_tick is not None and time.monotonic() >= next_tick:
+                self._tick()
+                next_tick = time.monotonic() + self.tick_interval
+
+            if item is self._STOP:
+                self._write(batch)
+                if self.tick is not None:
+                    self._tick()
+                self._close_file()
+                self._close_sink()
+                if self.compressor is not None:
+                    self.compressor.close()
+                return
+            elif isinstance(item, threading.Event):
+                self._write(batch)
+                batch, deadline = [], None
+                item.set()
+                continue
+            elif item is not None:
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+
+            if len(batch) >= self.batch_size or (deadline is not None and time.monotonic() >= deadline):
+                self._write(batch)
+                batch, deadline = [], None
+
+    def _write(self, batch):
+        if not batch:
+            return
+
+        lines = [self._format(record) for record in batch]
+        text = "".join(lines)
+        try:
+            if self.io is not None:
+                self.io.write(text)
+                self.io.flush()
+
+            if self.sink is not None:
+                unsent = self._send(lines)
+                self.sent += len(lines) - len(unsent)
+                text = "".join(unsent)
+
+            if self.logf is not None and text:
+                if self.file is None:
+                    self.file = open(self.logf, "a")
+                    # read from the file, so restarting (or reloading) doesn't reset its age.
+                    self.started_at = _first_record_time(self.logf)
+                # with a sink up, only the collector renames the file, or lines get lost.
+                owned = self.sink is None or (self.sock is None and self._collector_limits())
+                if owned and self._should_rotate(len(text)):
+                    self._rotate()
+                self.file.write(text)
+                self.file.flush()
+                if self.sink is not None:
+                    # the collector may rotate the file before our next fallback.
+                    self._close_file()
+        except (OSError, ValueError) as e:
+            # nowhere to log this to but stderr, and the thread has to keep going.
+            print(f"logger: couldn't write {len(batch)} records: {e}", file=sys.stderr)
+            self._close_file()
+        else:
+            self.written += len(batch)
+
+    def _send(self, lines):
+        """sends each line to the sink as a datagram, returns the ones that couldn't be sent"""
+        if self.sock is None:
+            if time.monotonic() < self.sink_retry_at:
+                return lines
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            sock.settimeout(self.SINK_TIMEOUT)
+            try:
+                sock.connect(self.sink)
+            except OSError:
+                sock.close()
+                self.sink_retry_at = time.monotonic() + self.SINK_RETRY
+                return lines
+            self.sock = sock
+
+        unsent = []
+        for i, line in enumerate(lines):
+            data = line.encode("utf-8")
+            if len(data) > self.MAX_DATAGRAM:
+                # the collector would only get the start of it, this one line goes to the file.
+                unsent.append(line)
+                continue
+            try:
+                self.sock.send(data)
+            except OSError as e:
+                if e.errno == errno.EMSGSIZE:
+                    unsent.append(line)
+                    continue
+                # the collector is gone (or stuck), use the file until it's back.
+                self._close_sink()
+                self.sink_retry_at = time.monotonic() + self.SINK_RETRY
+                return unsent + lines[i:]
+        return unsent
+
+    def _collector_limits(self):
+        """
+        takes max_bytes, max_age and backups from the file logsink.py writes next to
+        log_file, returns False if there's none (no collector has run yet).
+        """
+        try:
+            with open(self.logf + self.LIMITS_SUFFIX) as f:
+                limits = json.load(f)
+        except (OSError, ValueError):
+            return False
+
+        self.max_bytes = limits.get("max_bytes") or None
+        self.max_age = limits.get("max_age") or None
+        backups = limits.get("backups", 5)
+        if self.compressor is None:
+            if self.max_bytes or self.max_age:
+                self.compressor = Compressor(self.logf, backups)
+        else:
+            self.compressor.backups = backups
+        return True
+
+    def _close_sink(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def _should_rotate(self, incoming):
+        if self.compressor is None:
+            return False
+        size = self.file.tell()
+        if size == 0:
+            return False
+        if self.max_bytes and size + incoming > self.max_bytes:
+            return True
+        return bool(self.max_age) and time.time() - self.started_at >= self.max_age
+
+    def _rotate(self):
+        """moves the current file aside for the compressor and starts a new one"""
+        self._close_file()
+        stamp = dt.now().strftime("%Y%m%d-%H%M%S")
+        segment = f"{self.logf}.{stamp}"
+        n = 1
+        while os.path.exists(segment) or os.path.exists(segment + ".gz"):
+            segment = f"{self.logf}.{stamp}-{n}"
+            n += 1
+        os.rename(self.logf, segment)
+        self.compressor.put(segment)
+
+        self.file = open(self.logf, "a")
+        self.started_at = time.time()
+
+    def _tick(self):
+        try:
+            self.tick()
+        except Exception as e:
+            print(f"logger: periodic task failed: {e!r}", file=sys.stderr)
+
+    def _format(self, record):
+        if isinstance(record, str):
+            # already a line, eg. one logsink.py received.
+            return record
+        try:
+            if self.fmt == "jsonl":
+                return record.to_json() + "\n"
+            return f"{record}\n"
+        except Exception as e:
+            # a broken __str__ on some argument shouldn't take the writer down.
+            return f"<unprintable record: {e!r}>\n"
+
+    def _close_file(self):
+        if self.file is not None:
+            try:
+                self.file.close()
+            except OSError:
+                pass
+            self.file = None
+
+
+class Compressor(threading.Thread):
+    """
+    gzips rotated log segments off the writer thread, then deletes all but the
+    newest `backups` segments. segments left uncompressed by an earlier run
+    (qtile exited mid-compression) are picked up when it starts.
+    """
+
+    _STOP = object()
+
+    def __init__(self, log_file, backups=5):
+        super().__init__(name="logger-compressor", daemon=True)
+        self.logf = log_file
+        self.backups = backups
+        self.queue = queue.Queue()
+        self.pattern = re.compile(re.escape(os.path.basename(log_file)) + r"\.(\d{8}-\d{6})(?:-(\d+))?(\.gz)?$")
+        self.started = False
+
+    def put(self, segment):
+        # segments() gives absolute paths, so a relative log_file's segment still matches.
+        segment = os.path.abspath(segment)
+        if not self.started:
+            self.started = True
+            for leftover in self.segments():
+                if not leftover.endswith(".gz") and leftover != segment:
+                    self.queue.put(leftover)
+            self.start()
+        self.queue.put(segment)
+
+    def close(self, timeout=None):
+        if self.started and self.is_alive():
+            self.queue.put(self._STOP)
+            self.join(timeout)
+
+    def segments(self):
+        """every rotated segment of the log, oldest first"""
+        directory = os.path.dirname(os.path.abspath(self.logf))
+        found = []
+        for name in os.listdir(directory):
+            match = self.pattern.match(name)
+            if match:
+                stamp, n, _ = match.groups()
+                found.append(((stamp, int(n or 0)), os.path.join(directory, name)))
+        return [path for _, path in sorted(found)]
+
+    def run(self):
+        while True:
+            segment = self.queue.get()
+            if segment is self._STOP:
+                return
+            try:
+                self._compress(segment)
+                self._prune()
+            except OSError as e:
+                print(f"logger: couldn't compress '{segment}': {e}", file=sys.stderr)
+
+    def _compress(self, segment):
+        tmp = segment + ".gz.tmp"
+        with open(segment, "rb") as src, gzip.open(tmp, "wb") as dst:
+            shutil.copyfileobj(src, dst, 1 << 20)
+        os.replace(tmp, segment + ".gz")
+        os.remove(segment)
+
+    def _prune(self):
+        # segments still waiting to be compressed don't count (and aren't touched).
+        segments = [segment for segment in self.segments() if segment.endswith(".gz")]
+        for old in segments[:max(0, len(segments) - self.backups)]:
+            os.remove(old)
+
+
+# log_file/stats_file path -> the Logger whose writer thread is using it. qtile
+# re-runs config.py on every reload, which builds a new Logger for the same files
+# without closing the old one, so the old writer is closed once the new one starts.
+# this module is re-executed on a reload too (same globals), so the registry from
+# before the reload is kept rather than replaced with an empty one.
+_OWNERS = globals().get("_OWNERS", {})
+_OWNERS_LOCK = globals().get("_OWNERS_LOCK", threading.Lock())
+
+
 class Logger:
-    def __init__(self, log_file=None, debug=False, io_stream=None, logging=True):
+    def __init__(self, log_file=None, debug=False, io_stream=None, logging=True,
+                 max_queue=10000, batch_size=256, flush_interval=1.0,
+                 profile=False, stats_file=None, stats_interval=60,
+                 max_bytes=None, max_age=None, backups=5, fmt="text",
+                 max_repr=200, max_depth=2, max_items=8, sink=None, recent=0):
         self.logf = log_file
         self.debug = debug
         self._level = "log"
         self.io = io_stream
         self.logging = logging
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # with profile on every call is timed into a per function Histogram, even
+        # when debug is off and no line gets written. see function_stats().
+        self.profile = profile
+        self.stats_file = stats_file
+        self.stats_interval = stats_interval
+        self.histograms = {}
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.backups = backups
+        # "text" for the human readable lines, "jsonl" for one JSON object per line (see logquery.py).
+        self.fmt = fmt
+        # args and return values are only kept as bounded snapshots (see Snapshot).
+        self.snapshot = Snapshot(max_repr, max_depth, max_items)
+        self.limiters = []  # (name, Limiter) of every sampled/rate limited function
+        # path of a logsink.py socket, shared by every process logging to log_file.
+        # log_file is still written directly while the sink isn't running.
+        self.sink = sink
+        # the last `recent` calls are kept in memory, written or not (debug off), see recent().
+        self.recent_size = recent
+        self.recent_records = Ring(recent) if recent else None
+        self.writer = None
+        self._writer_lock = threading.Lock()
 
     def set_level(self, level):
         match level.lower():
@@ -123,46 +792,295 @@ class Logger:
         return self
 
     def record(self, data):
-        """writes the log data to the log file, or prints to self.io if io_stream was set to stderr or stdout"""
-        if self.io is not None:
-            print(data, file=self.io)
+        """
+        queues the log data to be written to the log file (and printed to self.io if
+        io_stream was set to stderr or stdout) by the writer thread.
+        """
+        if self.writer is None:
+            self._start_writer()
 
-        if not os.path.exists(self.logf):
-            open(self.logf, 'w').close()
-        
-        with open(self.logf, "a") as f:
-            f.write(str(data))
-            f.write("\n")
-        
-    def log(self, func):
+        self.writer.put(data)
+
+    def _start_writer(self):
+        self._claim_files()
+        with self._writer_lock:
+            if self.writer is None:
+                tick = self.dump_stats if self.profile and self.stats_file else None
+                writer = Writer(self.logf, self.io, self.max_queue, self.batch_size, self.flush_interval,
+                                tick, self.stats_interval, self.max_bytes, self.max_age, self.backups,
+                                self.fmt, self.sink)
+                writer.start()
+                atexit.register(writer.close)
+                self.writer = writer
+
+    def _claim_files(self):
+        """closes any other Logger's writer that's still writing to our log or stats file"""
+        previous = set()
+        with _OWNERS_LOCK:
+            for path in (self.logf, self.stats_file):
+                if not path:
+                    continue
+                path = os.path.abspath(os.path.expanduser(path))
+                owner = _OWNERS.get(path)
+                if owner is not None and owner is not self:
+                    previous.add(owner)
+                _OWNERS[path] = self
+
+        for owner in previous:
+            owner.close()
+
+    def flush(self, timeout=None):
+        """blocks until every record so far has been written"""
+        if self.writer is not None:
+            self.writer.flush(timeout)
+
+    def close(self, timeout=None):
+        """flushes and stops the writer thread, a later record starts a new one"""
+        for name, limiter in self.limiters:
+            if limiter.suppressed and self.writer is not None:
+                self.writer.put(Suppressed(name, limiter.take_suppressed()))
+
+        with self._writer_lock:
+            writer, self.writer = self.writer, None
+        with _OWNERS_LOCK:
+            for path, owner in list(_OWNERS.items()):
+                if owner is self:
+                    del _OWNERS[path]
+        if writer is not None:
+            writer.close(timeout)
+            atexit.unregister(writer.close)
+
+    def function_stats(self):
+        """returns call count, total/mean time and p50/p95/p99 latency per profiled function"""
+        return {name: hist.summary() for name, hist in self.histograms.items() if hist.count}
+
+    def dump_stats(self, path=None):
+        """writes function_stats() as a table to `path` (defaults to stats_file)"""
+        path = path or self.stats_file
+        cols = ["count", "errors", "total_ms", "mean_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms"]
+        stats = self.function_stats()
+        width = max([len(name) for name in stats] + [8])
+
+        lines = [f"# {dt.now().isoformat()}", f"{'function':<{width}} " + " ".join(f"{c:>10}" for c in cols)]
+        for name, summary in sorted(stats.items(), key=lambda item: -item[1]["total_ms"]):
+            lines.append(f"{name:<{width}} " + " ".join(f"{summary[c]:>10}" for c in cols))
+
+        # write then rename so readers never see half a table.
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp, path)
+
+    def recent(self, func=None, level=None, n=None):
+        """the last n (default all kept) records, oldest first, optionally only one function's/level's"""
+        if not self.recent_size:
+            return []
+        found = [data for data in self.recent_records
+                 if (func is None or data.obj_name == func) and (level is None or data._level == level.lower())]
+        return found[-n:] if n else found
+
+    def dump_recent(self, path=None, func=None, level=None, n=None):
+        """recent() as log lines, also written to `path` if given"""
+        text = "".join(f"{data}\n" for data in self.recent(func, level, n))
+        if path is not None:
+            with open(path, "w") as f:
+                f.write(text)
+        return text
+
+    def stats(self):
+        """returns how many records were written (sent to the sink) and dropped (queue full)"""
+        if self.writer is None:
+            return {"written": 0, "sent": 0, "dropped": 0, "queued": 0}
+        return {
+            "written": self.writer.written,
+            "sent": self.writer.sent,
+            "dropped": self.writer.dropped,
+            "queued": self.writer.queue.qsize(),
+        }
+
+    def log(self, func=None, *, sample=None, rate=None, burst=None):
+        """
+        decorator, logs (and with profile on, times) every call of func. for hot
+        functions only some of the calls can be written:
+
+            @LOGGER.log(sample=10)               # every 10th call
+            @LOGGER.log(sample=0.05)             # ~5% of calls, at random
+            @LOGGER.log(rate=2, burst=20)        # at most 2 records/sec, bursts of up to 20
+
+        calls that raise are always written. calls dropped by the rate limit are
+        counted and reported in a "suppressed N similar records" line before the
+        function's next record. profiling still counts every call.
+        """
+        if func is None:
+            return functools.partial(self.log, sample=sample, rate=rate, burst=burst)
+
+        # worked out once per function, everything else is per call.
         data = LogData()
         data.set_obj(func)
+        name, obj_type = data.obj_name, data.obj_type
+        hist = self.histograms.setdefault(getattr(func, "__qualname__", name), Histogram())
+        limiter = Limiter(sample, rate, burst) if sample is not None or rate is not None else None
+        if limiter is not None:
+            self.limiters.append((name, limiter))
 
-        def wrapper(*args, **kwargs):
-            if self.logging:               
-                data.obj_args = args
-                data.obj_kwargs = kwargs
+        if self.profile and self.stats_file and self.writer is None:
+            # the writer thread does the periodic stats dumps.
+            self._start_writer()
 
+        if inspect.iscoroutinefunction(func):
+            return self._wrap_coroutine(func, name, obj_type, hist, limiter)
+        if inspect.isasyncgenfunction(func):
+            return self._wrap_async_gen(func, name, obj_type, hist, limiter)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not (self.logging and (self.debug or self.profile or self.recent_size)):
+                # nothing gets written unless it raises, so don't capture anything.
                 try:
-                    value = func(*args, **kwargs)
-                except Exception as e:
-                    data.set_level("Error")
-                    self.record(data)
-                    raise e
-                else:
-                    data.set_level(self._level)
-            
-                data.return_val = value
-                
-                if self.debug: 
-                    self.record(data)
-            else:
+                    return func(*args, **kwargs)
+                except Exception:
+                    if self.logging:
+                        self.record(self._capture("error", name, obj_type, args, kwargs))
+                    raise
+
+            start, start_cpu = time.perf_counter(), time.thread_time()
+            try:
                 value = func(*args, **kwargs)
+            except Exception:
+                self._done(hist, limiter, "error", name, obj_type, args, kwargs, None,
+                           time.perf_counter() - start, time.thread_time() - start_cpu)
+                raise
 
+            self._done(hist, limiter, self._level, name, obj_type, args, kwargs, value,
+                       time.perf_counter() - start, time.thread_time() - start_cpu)
             return value
         
         return wrapper
 
+    def _done(self, hist, limiter, level, name, obj_type, args, kwargs, value, wall, cpu):
+        """profiles and/or records a finished call"""
+        if self.profile:
+            hist.add(wall, level == "error")
+        if level != "error" and not self.debug and not self.recent_size:
+            return
+        if level != "error" and limiter is not None and not limiter.allow():
+            return
+
+        data = self._capture(level, name, obj_type, args, kwargs, value, wall, cpu)
+        if self.recent_size:
+            self.recent_records.add(data)
+        if self.debug or level == "error":
+            if limiter is not None and limiter.suppressed:
+                self.record(Suppressed(name, limiter.take_suppressed()))
+            self.record(data)
+
+    def _capture(self, level, name, obj_type, args, kwargs, value=None, wall=None, cpu=None):
+        """a LogData holding snapshots of args/kwargs/value, not the objects themselves"""
+        args, kwargs = self.snapshot.capture_args(args, kwargs)
+        return LogData(level, name, obj_type, args, kwargs, self.snapshot.capture(value), None, wall, cpu,
+                       type(value))
+
+    def _wrap_coroutine(self, func, name, obj_type, hist, limiter):
+        """log() for async def functions, the record is made once the coroutine finishes"""
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            if not (self.logging and (self.debug or self.profile or self.recent_size)):
+                try:
+                    return await func(*args, **kwargs)
+                except Exception:
+                    if self.logging:
+                        self.record(self._capture("error", name, obj_type, args, kwargs))
+                    raise
+
+            timed = _Timed(func(*args, **kwargs))
+            start = time.perf_counter()
+            try:
+                value = await timed
+            except Exception:
+                self._done(hist, limiter, "error", name, obj_type, args, kwargs, None,
+                           time.perf_counter() - start, timed.cpu)
+                raise
+
+            self._done(hist, limiter, self._level, name, obj_type, args, kwargs, value,
+                       time.perf_counter() - start, timed.cpu)
+            return value
+
+        return wrapper
+
+    def _wrap_async_gen(self, func, name, obj_type, hist, limiter):
+        """
+        log() for async generators. time is only counted while the generator is
+        working on its next item, not while the consumer holds the last one.
+        the "return value" is the number of items it yielded.
+        """
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            agen = func(*args, **kwargs)
+            wall, cpu, items = 0.0, 0.0, 0
+            try:
+                while True:
+                    timed = _Timed(agen.__anext__())
+                    start = time.perf_counter()
+                    try:
+                        item = await timed
+                    except StopAsyncIteration:
+                        break
+                    finally:
+                        wall += time.perf_counter() - start
+                        cpu += timed.cpu
+                    items += 1
+                    yield item
+            except Exception:
+                if self.logging:
+                    self._done(hist, limiter, "error", name, obj_type, args, kwargs, f"{items} items", wall, cpu)
+                raise
+            finally:
+                await agen.aclose()
+
+            if self.logging:
+                self._done(hist, limiter, self._level, name, obj_type, args, kwargs, f"{items} items", wall, cpu)
+
+        return wrapper
+
+
+class _Timed:
+    """
+    awaits an awaitable, adding up the cpu time (of this thread) spent inside each
+    of its steps in self.cpu. time it spends suspended waiting on something else isn't counted.
+    """
+
+    __slots__ = ("awaitable", "cpu")
+
+    def __init__(self, awaitable):
+        self.awaitable = awaitable
+        self.cpu = 0.0
+
+    def __await__(self):
+        steps = self.awaitable.__await__()
+        send, throw = None, None
+
+        while True:
+            start = time.thread_time()
+            try:
+                if throw is not None:
+                    yielded = steps.throw(throw)
+                else:
+                    yielded = steps.send(send)
+            except StopIteration as e:
+                self.cpu += time.thread_time() - start
+                return e.value
+            except BaseException:
+                self.cpu += time.thread_time() - start
+                raise
+            self.cpu += time.thread_time() - start
+
+            send, throw = None, None
+            try:
+                send = yield yielded
+            except BaseException as e:
+                throw = e
 
 import sys
 
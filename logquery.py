@@ -0,0 +1,126 @@
+"""
+logquery.py
+
+stream-filters function logs written by logger.Logger(fmt="jsonl"), plain or
+gzipped (rotated segments), one line at a time so multi-gigabyte logs never
+have to fit in memory.
+
+usage:
+    python logquery.py LOG [LOG ...] [--func NAME] [--level LEVEL] [--since TIME] [--until TIME] [--stats]
+
+    python logquery.py ~/.local/share/qtile/qtile_user_funciton.log* --func reload_config --since 2022-09-11
+    python logquery.py log.jsonl --level error --stats
+
+TIME is an ISO date/datetime or a unix timestamp. --stats prints per function
+count/errors/mean/p50/p95/p99 instead of the matching records.
+"""
+
+import argparse
+import gzip
+import json
+import sys
+from datetime import datetime as dt
+
+from logger import Histogram
+
+
+def open_log(path):
+    if path == "-":
+        return sys.stdin
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", errors="replace")
+    return open(path, "r", encoding="utf-8", errors="replace")
+
+
+def parse_time(value):
+    try:
+        return float(value)
+    except ValueError:
+        return dt.fromisoformat(value).timestamp()
+
+
+def records(paths, func=None, level=None, since=None, until=None):
+    """yields every record in `paths` matching all of the given filters"""
+    # the writer uses compact separators, so cheap substring checks can throw out
+    # most lines before paying for json.loads.
+    func_needle = None if func is None else f'"func":{json.dumps(func)}'
+    level_needle = None if level is None else f'"level":{json.dumps(level.lower())}'
+
+    for path in paths:
+        with open_log(path) as f:
+            for line in f:
+                if func_needle is not None and func_needle not in line:
+                    continue
+                if level_needle is not None and level_needle not in line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # a text format line, or one cut short by a crash
+                if func is not None and record.get("func") != func:
+                    continue
+                if level is not None and record.get("level") != level.lower():
+                    continue
+                if since is not None and record.get("ts", 0) < since:
+                    continue
+                if until is not None and record.get("ts", 0) >= until:
+                    continue
+                yield record
+
+
+def aggregate(matching):
+    """per function call count, errors and latency percentiles, in constant memory per function"""
+    histograms = {}
+    untimed = {}
+    for record in matching:
+        if "suppressed" in record:
+            continue  # a rate limit summary line, not a call
+        name = record.get("func")
+        if "wall_ms" in record:
+            hist = histograms.get(name)
+            if hist is None:
+                hist = histograms[name] = Histogram()
+            hist.add(record["wall_ms"] / 1000, record.get("level") == "error")
+        else:
+            untimed[name] = untimed.get(name, 0) + 1
+    return histograms, untimed
+
+
+def print_stats(histograms, untimed, out=sys.stdout):
+    cols = ["count", "errors", "total_ms", "mean_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms"]
+    names = list(histograms) + [name for name in untimed if name not in histograms]
+    width = max([len(str(name)) for name in names] + [8])
+
+    print(f"{'function':<{width}} " + " ".join(f"{c:>10}" for c in cols), file=out)
+    for name, hist in sorted(histograms.items(), key=lambda item: -item[1].total):
+        summary = hist.summary()
+        print(f"{name:<{width}} " + " ".join(f"{summary[c]:>10}" for c in cols), file=out)
+    for name, count in untimed.items():
+        if name not in histograms:
+            print(f"{name:<{width}} {count:>10} (no timings)", file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="query JSON Lines function logs")
+    parser.add_argument("logs", nargs="+", help="log files, .gz segments are read as is, - for stdin")
+    parser.add_argument("--func", help="only records for this function")
+    parser.add_argument("--level", help="only records at this level (info, log, debug, error, panic)")
+    parser.add_argument("--since", type=parse_time, help="only records at or after this time")
+    parser.add_argument("--until", type=parse_time, help="only records before this time")
+    parser.add_argument("--stats", action="store_true", help="print per function aggregates")
+    args = parser.parse_args(argv)
+
+    matching = records(args.logs, args.func, args.level, args.since, args.until)
+    try:
+        if args.stats:
+            print_stats(*aggregate(matching))
+        else:
+            for record in matching:
+                sys.stdout.write(json.dumps(record, separators=(",", ":")) + "\n")
+    except BrokenPipeError:
+        # piped into head & co.
+        sys.stderr.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+logsink.py
+
+the one process that writes the function log. qtile and the helpers started from
+autostart.sh (frankentile.web, the discord bot, ...) log through
+logger.Logger(sink=SOCKET), which sends every line here as a datagram instead of
+each of them appending to the file on its own. lines are written in the order
+they arrive, by a logger.Writer, so batching and size/age rotation work the same
+as they do in process.
+
+the rotation limits are only set here, by the flags autostart.sh starts it with.
+they're also written to LOG_FILE.limits, so a process that has to write the
+file itself while the collector is down rotates it the same way.
+
+usage:
+    python logsink.py [--socket /tmp/qtile/log.sock] [--log-file FILE] [--max-bytes N] [--max-age SECONDS] [--backups N]
+"""
+
+import argparse
+import json
+import os
+import signal
+import socket
+import sys
+
+from logger import Writer
+
+
+SOCKET = "/tmp/qtile/log.sock"
+LOG_FILE = os.path.expanduser("~/.local/share/qtile/qtile_user_funciton.log")
+MAX_DATAGRAM = Writer.MAX_DATAGRAM  # senders write bigger lines to the file themselves
+RCVBUF = 1 << 20  # room for bursts while the writer is busy
+
+
+def bind(path):
+    """binds the sink's socket, returns None if another collector is already on it"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if os.path.exists(path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            probe.connect(path)
+        except OSError:
+            os.unlink(path)  # left over from a collector that died
+        else:
+            return None
+        finally:
+            probe.close()
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RCVBUF)
+    sock.bind(path)
+    return sock
+
+
+def write_limits(log_file, max_bytes, max_age, backups):
+    """leaves the rotation limits next to the log for senders falling back to it, see logger.Writer"""
+    path = log_file + Writer.LIMITS_SUFFIX
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"max_bytes": max_bytes, "max_age": max_age, "backups": backups}, f)
+    os.replace(tmp, path)
+
+
+def serve(sock, writer):
+    while True:
+        try:
+            data = sock.recv(MAX_DATAGRAM)
+        except InterruptedError:
+            continue
+        except OSError:
+            return  # closed by stop()
+        line = data.decode("utf-8", errors="replace")
+        if not line.endswith("\n"):
+            line += "\n"
+        writer.put(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="collects log lines from every process into one file")
+    parser.add_argument("--socket", default=SOCKET)
+    parser.add_argument("--log-file", default=LOG_FILE)
+    parser.add_argument("--max-bytes", type=int, default=0, help="rotate past this size, 0 for never")
+    parser.add_argument("--max-age", type=int, default=0, help="rotate after this many seconds, 0 for never")
+    parser.add_argument("--backups", type=int, default=5, help="gzipped segments to keep")
+    args = parser.parse_args(argv)
+
+    sock = bind(args.socket)
+    if sock is None:
+        print(f"logsink: already running on {args.socket}", file=sys.stderr)
+        return 1
+
+    os.makedirs(os.path.dirname(args.log_file), exist_ok=True)
+    write_limits(args.log_file, args.max_bytes, args.max_age, args.backups)
+    writer = Writer(args.log_file, max_queue=100000, max_bytes=args.max_bytes or None,
+                    max_age=args.max_age or None, backups=args.backups)
+    writer.start()
+
+    def stop(*_):
+        sock.close()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    try:
+        serve(sock, writer)
+    finally:
+        writer.close()
+        if os.path.exists(args.socket):
+            os.unlink(args.socket)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
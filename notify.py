@@ -0,0 +1,92 @@
+######################################
+# Desktop notifications over D-Bus   #
+######################################
+
+# a wrapper for org.freedesktop.Notifications on the shared session bus
+# connection (bus.py). the interface is described statically, so sending a
+# notification is one method call, no introspection round trip.
+
+
+from libqtile.log_utils import logger
+from dbus_next import Variant
+from dbus_next.errors import DBusError
+from bus import get_bus, run_soon
+
+
+
+BUS_NAME = "org.freedesktop.Notifications"
+OBJECT_PATH = "/org/freedesktop/Notifications"
+INTROSPECTION = """
+<node>
+  <interface name="org.freedesktop.Notifications">
+    <method name="Notify">
+      <arg type="s" name="app_name" direction="in"/>
+      <arg type="u" name="replaces_id" direction="in"/>
+      <arg type="s" name="app_icon" direction="in"/>
+      <arg type="s" name="summary" direction="in"/>
+      <arg type="s" name="body" direction="in"/>
+      <arg type="as" name="actions" direction="in"/>
+      <arg type="a{sv}" name="hints" direction="in"/>
+      <arg type="i" name="expire_timeout" direction="in"/>
+      <arg type="u" name="id" direction="out"/>
+    </method>
+    <method name="CloseNotification">
+      <arg type="u" name="id" direction="in"/>
+    </method>
+  </interface>
+</node>
+"""
+LOW, NORMAL, CRITICAL = 0, 1, 2  # urgency levels
+
+
+class Notifier:
+    """
+    sends notifications as `app_name`. notifications sent with the same `key`
+    replace each other, so pressing a key repeatedly updates one popup
+    instead of stacking new ones.
+    """
+
+    def __init__(self, app_name="qtile"):
+        self.app_name = app_name
+        self.ids = {}  # key -> id of the last notification sent with it
+        self.interface = None
+        self.bus = None
+
+    async def _interface(self):
+        bus = await get_bus()
+        if self.interface is None or bus is not self.bus:
+            proxy = bus.get_proxy_object(BUS_NAME, OBJECT_PATH, INTROSPECTION)
+            self.interface = proxy.get_interface(BUS_NAME)
+            self.bus = bus
+        return self.interface
+
+    async def notify(self, summary, body="", key=None, urgency=NORMAL, timeout=3500, icon=""):
+        """shows a notification, returns its id (None if it couldn't be sent)"""
+        try:
+            interface = await self._interface()
+            nid = await interface.call_notify(
+                self.app_name, self.ids.get(key, 0), icon, summary, body, [],
+                {"urgency": Variant("y", urgency)}, timeout,
+            )
+        except (DBusError, OSError) as e:
+            logger.warning(f"couldn't send notification '{summary}': {e!r}")
+            return None
+
+        if key is not None:
+            self.ids[key] = nid
+        return nid
+
+    async def close(self, key):
+        """closes the notification last sent with `key`, if it's still up"""
+        nid = self.ids.pop(key, None)
+        if nid is None:
+            return
+        try:
+            interface = await self._interface()
+            await interface.call_close_notification(nid)
+        except (DBusError, OSError) as e:
+            logger.warning(f"couldn't close notification {nid}: {e!r}")
+
+    def send(self, *args, **kwargs):
+        """notify() for sync callers, it's scheduled on the loop rather than awaited"""
+        return run_soon(self.notify(*args, **kwargs))
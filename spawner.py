@@ -0,0 +1,198 @@
+######################################
+# Non-blocking process spawner       #
+######################################
+
+# starts commands with asyncio.create_subprocess_exec so a key binding returns
+# as soon as the child is forked, whatever the command does after. every
+# child is awaited (and so reaped, no zombies) by its own task, which records
+# its exit code and runtime. at most `limit` copies of one command run at
+# once, more wait their turn. the process table (running + the last HISTORY
+# finished) is there for debugging:
+#
+#     qtile cmd-obj -o cmd -f fire_user_hook -a dump_processes
+#
+# writes it to PROCESS_TABLE.
+
+
+from libqtile.log_utils import logger
+from libqtile import hook
+from collections import deque
+from datetime import datetime as dt
+import asyncio
+import os
+import re
+import shlex
+import time
+from bus import run_soon
+
+
+
+MAX_PER_COMMAND = 4  # default number of copies of one command allowed to run at once
+LIMITS = {
+    # commands that shouldn't pile up when their key is mashed.
+    "autorandr": 1,
+    "rofi": 1,
+    "flameshot": 1,
+}
+# run a script named by their first non option argument, that script is what's limited.
+INTERPRETERS = re.compile(r"^(sh|bash|dash|zsh|fish|python[0-9.]*|perl|ruby|node)$")
+HISTORY = 64  # finished children kept in the table
+PROCESS_TABLE = "/tmp/qtile/processes.txt"
+
+
+class Child:
+    """one spawned command"""
+
+    __slots__ = ("cmd", "name", "pid", "started", "start", "runtime", "returncode")
+
+    def __init__(self, cmd, name):
+        self.cmd = cmd
+        self.name = name
+        self.pid = None
+        self.started = None  # wall clock time it was forked
+        self.start = None  # time.monotonic() of the same
+        self.runtime = None  # seconds, once it's exited
+        self.returncode = None
+
+    @property
+    def state(self):
+        if self.pid is None:
+            return "waiting" if self.returncode is None else "failed"
+        return "running" if self.returncode is None else "exited"
+
+    def info(self):
+        runtime = self.runtime if self.runtime is not None else (
+            time.monotonic() - self.start if self.start is not None else None)
+        return {
+            "pid": self.pid,
+            "cmd": self.cmd if isinstance(self.cmd, str) else shlex.join(self.cmd),
+            "state": self.state,
+            "started": dt.fromtimestamp(self.started).isoformat() if self.started else None,
+            "runtime": round(runtime, 3) if runtime is not None else None,
+            "returncode": self.returncode,
+        }
+
+
+class Spawner:
+    def __init__(self, limits=LIMITS, default_limit=MAX_PER_COMMAND, history=HISTORY):
+        self.limits = limits
+        self.default_limit = default_limit
+        self.running = {}  # pid -> Child
+        self.waiting = []  # Child waiting on its command's limit
+        self.finished = deque(maxlen=history)
+        self.semaphores = {}  # command name -> asyncio.Semaphore
+        # counters for stats()
+        self.spawned = 0
+        self.failed = 0
+
+    def spawn(self, cmd, limit=None):
+        """
+        starts cmd and returns right away (for key bindings and sync hooks). a
+        string is run by /bin/sh like os.system would, a list is exec'd as is.
+        """
+        return run_soon(self.run(cmd, limit))
+
+    async def run(self, cmd, limit=None):
+        """starts cmd once its command is under its limit, waits for it to exit, returns its Child"""
+        child = Child(cmd, _name(cmd, self.limits))
+        argv = ["/bin/sh", "-c", cmd] if isinstance(cmd, str) else list(cmd)
+
+        self.waiting.append(child)
+        try:
+            async with self._semaphore(child.name, limit):
+                self.waiting.remove(child)
+                try:
+                    # stdout/stderr are inherited (ie. qtile's log) like Popen and os.system did.
+                    proc = await asyncio.create_subprocess_exec(
+                        *argv, stdin=asyncio.subprocess.DEVNULL, start_new_session=True,
+                    )
+                except OSError as e:
+                    logger.error(f"couldn't start {child.info()['cmd']}: {e!r}")
+                    self.failed += 1
+                    child.returncode = -1
+                    self.finished.append(child)
+                    return child
+
+                child.pid, child.started, child.start = proc.pid, time.time(), time.monotonic()
+                self.running[proc.pid] = child
+                self.spawned += 1
+                try:
+                    child.returncode = await proc.wait()
+                finally:
+                    child.runtime = time.monotonic() - child.start
+                    self.running.pop(proc.pid, None)
+                    self.finished.append(child)
+        finally:
+            if child in self.waiting:
+                self.waiting.remove(child)
+
+        if child.returncode:
+            logger.info(f"{child.info()['cmd']} exited with {child.returncode}")
+        return child
+
+    def _semaphore(self, name, limit):
+        semaphore = self.semaphores.get(name)
+        if semaphore is None:
+            semaphore = self.semaphores[name] = asyncio.Semaphore(
+                limit or self.limits.get(name, self.default_limit))
+        return semaphore
+
+    def table(self):
+        """running, waiting and recently finished children, oldest first in each"""
+        return ([child.info() for child in self.running.values()]
+                + [child.info() for child in self.waiting]
+                + [child.info() for child in self.finished])
+
+    def stats(self):
+        return {"running": len(self.running), "waiting": len(self.waiting), "spawned": self.spawned,
+                "failed": self.failed}
+
+
+def _name(cmd, limits=LIMITS):
+    """
+    what a command's concurrency limit is counted by. programs listed in limits
+    go by their basename, scripts run by one of INTERPRETERS by the script, and
+    anything else by its whole command line. so unrelated `bash ...` or
+    `alacritty -e ...` commands never wait on each other.
+    """
+    try:
+        argv = shlex.split(cmd) if isinstance(cmd, str) else list(cmd)
+    except ValueError:
+        argv = cmd.split()
+    if not argv:
+        return ""
+
+    prog = os.path.basename(argv[0])
+    if prog in limits:
+        return prog
+    if INTERPRETERS.match(prog):
+        for i, arg in enumerate(argv[1:], 1):
+            if arg in ("-c", "-m"):
+                break  # inline code or a module, the whole command it is.
+            if not arg.startswith("-"):
+                script = os.path.basename(arg)
+                return script if script in limits else arg
+    return shlex.join(argv)
+
+
+SPAWNER = Spawner()
+
+
+def spawn(cmd, limit=None):
+    """SPAWNER.spawn(), starts cmd without waiting on it"""
+    return SPAWNER.spawn(cmd, limit)
+
+
+def process_table():
+    """returns the spawner's process table, see Spawner.table()"""
+    return SPAWNER.table()
+
+
+@hook.subscribe.user("dump_processes")
+def dump_processes():
+    os.makedirs(os.path.dirname(PROCESS_TABLE), exist_ok=True)
+    cols = ["pid", "state", "started", "runtime", "returncode", "cmd"]
+    lines = ["\t".join(cols)]
+    lines += ["\t".join(str(row[c]) for c in cols) for row in process_table()]
+    with open(PROCESS_TABLE, "w") as f:
+        f.write("\n".join(lines) + "\n")